@@ -1,14 +1,15 @@
 import os
 import secrets
-from datetime import datetime
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 
+from .replica import RoutingSession
+
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 bcrypt = Bcrypt()
@@ -16,49 +17,14 @@ bcrypt = Bcrypt()
 # Models (only existing ones)
 from .models import User, Student, Payment, Teacher
 
-# Fee structure (class, term) -> amount
-FEE_STRUCTURE = {
-    ('JSS 1', 'First Term'): 25000.00,
-    ('JSS 1', 'Second Term'): 20000.00,
-    ('JSS 1', 'Third Term'): 20000.00,
-    ('JSS 2', 'First Term'): 27000.00,
-    ('JSS 2', 'Second Term'): 22000.00,
-    ('JSS 2', 'Third Term'): 22000.00,
-    ('JSS 3', 'First Term'): 30000.00,
-    ('JSS 3', 'Second Term'): 25000.00,
-    ('JSS 3', 'Third Term'): 25000.00,
-    ('SS 1', 'First Term'): 35000.00,
-    ('SS 1', 'Second Term'): 30000.00,
-    ('SS 1', 'Third Term'): 30000.00,
-    ('SS 2', 'First Term'): 37000.00,
-    ('SS 2', 'Second Term'): 32000.00,
-    ('SS 2', 'Third Term'): 32000.00,
-    ('SS 3', 'First Term'): 40000.00,
-    ('SS 3', 'Second Term'): 35000.00,
-    ('SS 3', 'Third Term'): 35000.00,
-}
-
 def get_current_school_period():
     """
-    Determines the current academic year and term based on the current month.
+    The current period, with `id`, `academic_year`, `term` and `sequence`.
+    Looked up by today's date in the cached `periods` table; see
+    app/reference_data.py.
     """
-    now = datetime.now()
-    month = now.month
-    
-    if 9 <= month <= 12:
-        academic_year = f"{now.year}/{now.year + 1}"
-        term = "First Term"
-    elif 1 <= month <= 4:
-        academic_year = f"{now.year - 1}/{now.year}"
-        term = "Second Term"
-    else: # 5 <= month <= 8
-        academic_year = f"{now.year - 1}/{now.year}"
-        term = "Third Term"
-        
-    return {
-        'academic_year': academic_year,
-        'term': term
-    }
+    from .reference_data import current_period
+    return current_period()
 
 def create_app():
     app = Flask(__name__, instance_relative_config=True) # Use instance_relative_config
@@ -74,6 +40,53 @@ def create_app():
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'site.db')
 
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Connection pool settings for Postgres, from DB_POOL_* (see app/database.py)
+    from .database import engine_options
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    # Optional read replica for the directory, search, export and report pages (see app/replica.py)
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        replica_url = replica_url.replace("postgresql://", "postgresql+psycopg2://", 1)
+        app.config['SQLALCHEMY_BINDS'] = {'replica': {'url': replica_url, **engine_options(replica_url)}}
+    # Reads fall back to the primary while the replica is more than this many seconds behind;
+    # the lag is checked at most once per interval in each process
+    app.config['DATABASE_REPLICA_MAX_LAG'] = float(os.environ.get('DATABASE_REPLICA_MAX_LAG', 5))
+    app.config['DATABASE_REPLICA_CHECK_INTERVAL'] = float(os.environ.get('DATABASE_REPLICA_CHECK_INTERVAL', 5))
+    # Seconds a user's reads stay on the primary after they change something
+    app.config['DATABASE_REPLICA_STICKY_SECONDS'] = float(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', 10))
+    # Number of students per page in the /students directory
+    app.config['STUDENTS_PAGE_SIZE'] = int(os.environ.get('STUDENTS_PAGE_SIZE', 50))
+    # Background report rendering (see app/jobs.py)
+    app.config['REPORT_JOB_WORKERS'] = int(os.environ.get('REPORT_JOB_WORKERS', 2))
+    # A running job stamps a heartbeat this often; one silent for REPORT_JOB_STALE_AFTER
+    # seconds lost its process and is queued again
+    app.config['REPORT_JOB_HEARTBEAT_INTERVAL'] = float(os.environ.get('REPORT_JOB_HEARTBEAT_INTERVAL', 10))
+    app.config['REPORT_JOB_STALE_AFTER'] = int(os.environ.get('REPORT_JOB_STALE_AFTER', 60))
+    # Days a finished or failed report job and its PDF are kept
+    app.config['REPORT_JOB_RETENTION_DAYS'] = int(os.environ.get('REPORT_JOB_RETENTION_DAYS', 7))
+    # On-disk cache of rendered payment receipts (see app/receipts.py)
+    app.config['RECEIPT_CACHE_DIR'] = os.environ.get('RECEIPT_CACHE_DIR', os.path.join(app.instance_path, 'receipts'))
+    app.config['RECEIPT_CACHE_MAX_BYTES'] = int(os.environ.get('RECEIPT_CACHE_MAX_BYTES', 100 * 1024 * 1024))
+    # Shared cache (see app/cache.py): a redis:// URL, or empty for per-process memory
+    app.config['CACHE_URL'] = os.environ.get('CACHE_URL', '')
+    app.config['CACHE_DEFAULT_TTL'] = int(os.environ.get('CACHE_DEFAULT_TTL', 300))
+    # Upper bound on how stale dashboard figures can be in other worker processes
+    app.config['METRICS_CACHE_TTL'] = int(os.environ.get('METRICS_CACHE_TTL', 300))
+    # Upper bound on how stale classes and fees can be in other worker processes
+    app.config['REFERENCE_DATA_TTL'] = int(os.environ.get('REFERENCE_DATA_TTL', 300))
+    # How long the logged-in user's id, name and role are cached (see app/identity.py)
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+    # Without a shared cache, seconds between checks that a cached user's session version is current
+    # (0 checks on every request)
+    app.config['USER_VERSION_CHECK_INTERVAL'] = int(os.environ.get('USER_VERSION_CHECK_INTERVAL', 5))
+    # Password hashing (see app/passwords.py): bcrypt cost is calibrated to the
+    # target time at startup unless PASSWORD_HASH_ROUNDS is set
+    app.config['PASSWORD_HASH_TARGET_MS'] = int(os.environ.get('PASSWORD_HASH_TARGET_MS', 250))
+    app.config['PASSWORD_HASH_ROUNDS'] = int(os.environ.get('PASSWORD_HASH_ROUNDS', 0))
+    # Hashing threads, queued hashes beyond them, and seconds to wait for a place in the queue
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+    app.config['PASSWORD_HASH_WAIT'] = float(os.environ.get('PASSWORD_HASH_WAIT', 5))
 
     # Init extensions with the app
     db.init_app(app)
@@ -81,22 +94,49 @@ def create_app():
     login_manager.init_app(app)
     bcrypt.init_app(app)
     login_manager.login_view = 'main.login'
+
+    # SQLite PRAGMAs on every connection, and connection pool counters
+    from . import database
+    database.init_app(app)
+
+    # Replica lag checks for the views that read from it
+    from . import replica
+    replica.init_app(app)
+
+    # Password hashing service, calibrated for this machine
+    from . import passwords
+    passwords.init_app(app)
     
+    # The logged-in user comes from a cache that session events keep current
+    from .identity import load_identity
+
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_identity(user_id)
     
-    # Currency formatting filter
-    @app.template_filter('format_currency')
-    def format_currency_filter(value):
-        try:
-            return f"₦{float(value):,.2f}"
-        except (ValueError, TypeError):
-            return "₦0.00"
+    # Currency formatting filter (amounts are exact Decimals, see app/money.py)
+    from .money import format_currency
+    app.add_template_filter(format_currency, 'format_currency')
 
     # Register blueprint
     from .routes import main as main_blueprint
     app.register_blueprint(main_blueprint)
+
+    # Balance ledger maintenance and its CLI commands
+    from . import ledger
+    ledger.init_app(app)
+
+    # `flask purge-report-jobs` clears out old report PDFs
+    from . import jobs
+    jobs.init_app(app)
+
+    # `flask check-indexes` guards the hot queries against full table scans
+    from . import query_plans
+    query_plans.init_app(app)
+
+    # Student full-text search index
+    from . import search
+    search.init_app(app)
     
     return app
 
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+from flask import current_app
+
+
+class MemoryCache:
+    """
+    Thread-safe in-process cache with per-key expiry. Each worker process has
+    its own copy, so writes made by other processes are only seen once the
+    entry expires.
+    """
+    # Whether every worker sees the same entries.
+    shared = False
+
+    def __init__(self, default_ttl=300):
+        self.default_ttl = default_ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is not None and entry[0] <= now:
+                    del self._data[key]
+                    entry = None
+                values.append(None if entry is None else entry[1])
+        return values
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache:
+    """
+    Cache shared by every worker through Redis. Values are stored as JSON,
+    so only plain data (dicts, lists, strings, numbers) can be cached.
+    Needs the optional `redis` package.
+    """
+    shared = True
+
+    def __init__(self, url, default_ttl=300, prefix='aam:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_URL points at Redis but the 'redis' package is not installed.") from e
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        raw = self._client.mget([self.prefix + key for key in keys])
+        return [None if value is None else json.loads(value) for value in raw]
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.prefix + key, json.dumps(value), ex=ttl or self.default_ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+
+def get_cache():
+    """
+    The cache for the current app: Redis when CACHE_URL is a redis:// URL,
+    otherwise an in-process `MemoryCache`. Created on first use.
+    """
+    app = current_app._get_current_object()
+    cache = app.extensions.get('cache')
+    if cache is None:
+        url = app.config['CACHE_URL']
+        ttl = app.config['CACHE_DEFAULT_TTL']
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            cache = RedisCache(url, default_ttl=ttl)
+        else:
+            cache = MemoryCache(default_ttl=ttl)
+        app.extensions['cache'] = cache
+    return cache
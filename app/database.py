@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import and_, event, insert, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def engine_options(database_uri):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the database at `database_uri`.
+
+    Postgres gets a pool sized from the environment: DB_POOL_SIZE,
+    DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (seconds to wait for a connection),
+    DB_POOL_RECYCLE (seconds before a connection is replaced) and
+    DB_POOL_PRE_PING (1 to test connections before use). SQLite is tuned per
+    connection instead; see `sqlite_pragmas`.
+    """
+    if make_url(database_uri).get_backend_name() != 'postgresql':
+        return {}
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': bool(_env_int('DB_POOL_PRE_PING', 1)),
+    }
+
+
+def sqlite_pragmas():
+    """
+    PRAGMAs run on every new SQLite connection. WAL lets readers carry on
+    while a write commits, and synchronous=NORMAL is safe under WAL. Sizes
+    come from SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE_KB and
+    SQLITE_MMAP_SIZE_MB.
+    """
+    return [
+        'PRAGMA journal_mode=WAL',
+        f"PRAGMA busy_timeout={_env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)}",
+        'PRAGMA synchronous=NORMAL',
+        # Negative values are in KiB rather than pages.
+        f"PRAGMA cache_size=-{_env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024)}",
+        f"PRAGMA mmap_size={_env_int('SQLITE_MMAP_SIZE_MB', 256) * 1024 * 1024}",
+    ]
+
+
+class PoolStats:
+    """
+    Connection pool counters for one engine, updated by pool events.
+    `held_seconds` is the total time connections spent checked out.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.invalidated = 0
+        self.held_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        connection_record.info['checked_out_at'] = time.monotonic()
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        started = connection_record.info.pop('checked_out_at', None)
+        if started is None:
+            return
+        with self._lock:
+            self.checked_out -= 1
+            self.held_seconds += time.monotonic() - started
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidated += 1
+
+    def as_dict(self):
+        with self._lock:
+            stats = {
+                'backend': self.engine.url.get_backend_name(),
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checked_out': self.checked_out,
+                'peak_checked_out': self.peak_checked_out,
+                'invalidated': self.invalidated,
+                'held_seconds': round(self.held_seconds, 3),
+            }
+        stats['pool'] = self.engine.pool.status()
+        return stats
+
+
+def _tune_sqlite(engine):
+    if engine.url.database in (None, '', ':memory:'):
+        return
+    pragmas = sqlite_pragmas()
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    event.listen(engine, 'connect', set_pragmas)
+
+
+def pool_stats():
+    """
+    Pool counters for every engine of the current app, keyed by bind name
+    (None for the default database).
+    """
+    return {
+        'default' if bind is None else bind: stats.as_dict()
+        for bind, stats in current_app.extensions['database_stats'].items()
+    }
+
+
+def upsert(connection, table, values, index_elements=None, set_=None):
+    """
+    Inserts `values` into `table` in one statement that is safe to race. If
+    a row with the same `index_elements` already exists, `set_` is applied
+    to it instead; without `set_` the insert is simply skipped, and any
+    unique constraint counts as a conflict when `index_elements` is None.
+
+    SQLite and Postgres use INSERT ... ON CONFLICT. Other databases try the
+    insert in a savepoint and fall back to an UPDATE on the same key.
+    """
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table).values(**values)
+        if set_ is None:
+            stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+        else:
+            stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
+        connection.execute(stmt)
+        return
+
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(table).values(**values))
+    except IntegrityError:
+        if set_ is None:
+            return
+        key = and_(*(column == values[column.name] for column in index_elements))
+        connection.execute(update(table).where(key).values(set_))
+
+
+def transaction_info(session):
+    """
+    A dict for notes about the session's current transaction. It is dropped
+    when the transaction commits or rolls back.
+    """
+    return session.info.setdefault('transaction', {})
+
+
+def on_commit(session, callback, *items):
+    """
+    Calls `callback(*items)` once the session's current transaction commits,
+    so caches are only dropped when other connections can see the change.
+    Calls registered with the same callback during one transaction are
+    merged into a single call with the union of their items. Nothing is
+    called if the transaction rolls back.
+    """
+    pending = transaction_info(session).setdefault('on_commit', {})
+    pending.setdefault(callback, set()).update(items)
+
+
+def _after_commit(session):
+    pending = session.info.pop('transaction', {}).get('on_commit', {})
+    if current_app:
+        for callback, items in pending.items():
+            callback(*items)
+
+
+def _after_rollback(session):
+    session.info.pop('transaction', None)
+
+
+for _name, _listener in (('after_commit', _after_commit), ('after_rollback', _after_rollback)):
+    if not event.contains(db.session, _name, _listener):
+        event.listen(db.session, _name, _listener)
+
+
+def init_app(app):
+    """
+    Attaches the per-connection SQLite settings and the pool counters to
+    each of the app's engines. Call after `db.init_app`.
+    """
+    stats = {}
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                _tune_sqlite(engine)
+            stats[bind] = PoolStats(engine)
+            event.listen(engine, 'connect', stats[bind].on_connect)
+            event.listen(engine, 'checkout', stats[bind].on_checkout)
+            event.listen(engine, 'checkin', stats[bind].on_checkin)
+            event.listen(engine, 'invalidate', stats[bind].on_invalidate)
+    app.extensions['database_stats'] = stats
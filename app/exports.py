@@ -0,0 +1,90 @@
+import csv
+import io
+import tempfile
+
+from .models import Student
+from .fee_status import fee_status_rows
+from .money import ZERO
+
+# Rows fetched per round trip from the server-side cursor.
+EXPORT_FETCH_SIZE = 1000
+# CSV rows buffered before a chunk is sent to the client.
+CSV_FLUSH_ROWS = 500
+# Bytes per chunk when streaming a finished XLSX file.
+FILE_CHUNK_SIZE = 64 * 1024
+
+HEADER = ['Reg. Number', 'Name', 'Class', 'Expected', 'Paid', 'Outstanding', 'Status']
+
+
+def student_directory_rows(student_query, period_id, status=None):
+    """
+    Yields one export row per student in `student_query` with the fee
+    figures for the period `period_id`, ordered like the directory.
+
+    The rows come from a server-side cursor in batches of
+    EXPORT_FETCH_SIZE as plain tuples, so no ORM objects are built and only
+    one batch is held in memory however many students there are.
+    """
+    rows = (
+        fee_status_rows(student_query, period_id, status=status)
+        .order_by(Student.class_id, Student.name, Student.reg_number)
+        .yield_per(EXPORT_FETCH_SIZE)
+    )
+    for reg_number, name, student_class, expected_amount, amount_paid, fee_status in rows:
+        yield [
+            reg_number,
+            name,
+            student_class,
+            expected_amount,
+            amount_paid,
+            max(expected_amount - amount_paid, ZERO),
+            fee_status,
+        ]
+
+
+def stream_csv(rows):
+    """
+    Yields a CSV document (header first) in chunks of CSV_FLUSH_ROWS rows.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # A byte order mark so Excel opens the file as UTF-8.
+    buffer.write('\ufeff')
+    writer.writerow(HEADER)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_xlsx(rows, title='Students'):
+    """
+    Returns a generator yielding an XLSX workbook of `rows` in chunks. The
+    sheet is written in openpyxl's write-only mode to a temporary file, which
+    keeps memory flat, and then streamed from disk.
+
+    Needs the optional `openpyxl` package; raises ImportError up front, before
+    any response has started, if it is missing.
+    """
+    from openpyxl import Workbook
+
+    def generate():
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(title)
+        sheet.append(HEADER)
+        for row in rows:
+            sheet.append(row)
+
+        with tempfile.TemporaryFile() as output:
+            workbook.save(output)
+            output.seek(0)
+            while True:
+                chunk = output.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    return generate()
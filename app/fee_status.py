@@ -0,0 +1,129 @@
+from sqlalchemy import and_, case, or_, select
+
+from . import db
+from .models import Student, Payment, Fee, StudentTermBalance, Class, Period
+from .money import ZERO
+
+# Status labels shared by the routes and the templates.
+PAID = 'Paid'
+DEFAULTER = 'Defaulter'
+
+
+def _fee_status(expected_amount, amount_paid):
+    # No fee set for the period counts as paid.
+    return case(
+        (and_(expected_amount > 0, amount_paid < expected_amount), DEFAULTER),
+        else_=PAID
+    )
+
+
+def _fee_status_columns():
+    """
+    Expected amount, amount paid and status expressions over the ledger and fee joins.
+    """
+    expected_amount = db.func.coalesce(StudentTermBalance.expected_amount, Fee.amount, 0)
+    amount_paid = db.func.coalesce(StudentTermBalance.amount_paid, 0)
+    return expected_amount, amount_paid, _fee_status(expected_amount, amount_paid)
+
+
+def _with_fee_status(query, period_id, status):
+    expected_amount, amount_paid, fee_status = _fee_status_columns()
+    query = (
+        query
+        .outerjoin(StudentTermBalance, and_(
+            StudentTermBalance.student_reg_number == Student.reg_number,
+            StudentTermBalance.period_id == period_id
+        ))
+        .outerjoin(Fee, and_(
+            Fee.class_id == Student.class_id,
+            Fee.period_id == period_id
+        ))
+        .add_columns(
+            expected_amount.label('expected_amount'),
+            amount_paid.label('amount_paid'),
+            fee_status.label('fee_status')
+        )
+    )
+
+    if status:
+        query = query.filter(fee_status == status)
+    return query
+
+
+def fee_status_query(student_query, period_id, status=None):
+    """
+    Extends a `Student` query with the expected amount, amount paid and
+    fee status for the given period.
+
+    Every row comes back as `(student, expected_amount, amount_paid, fee_status)`
+    from a single statement that joins `students` to their ledger row in
+    `student_term_balances`, so the caller never needs a query per student.
+    Students with no payments for the period have no ledger row and fall
+    back to the `fees` schedule. Passing `status` ('Paid' or 'Defaulter')
+    filters the rows in SQL.
+    """
+    return _with_fee_status(student_query, period_id, status)
+
+
+def fee_status_rows(student_query, period_id, status=None):
+    """
+    Same as `fee_status_query`, but returns plain column rows
+    `(reg_number, name, student_class, expected_amount, amount_paid, fee_status)`
+    instead of `Student` objects. Meant for reports and exports that stream
+    many rows and have no use for ORM instances.
+    """
+    # Labelled so `row.name` stays the student's name, which the report
+    # keyset cursor reads.
+    columns_only = student_query.join(Class, Class.id == Student.class_id) \
+        .with_entities(Student.reg_number, Student.name, Class.name.label('student_class'))
+    return _with_fee_status(columns_only, period_id, status)
+
+
+def students_with_fee_status(rows):
+    """
+    Unpacks rows from `fee_status_query` into a list of students, attaching
+    `fee_status`, `expected_amount`, `amount_paid` and `outstanding_amount`
+    so templates can keep reading them straight off the student.
+    """
+    students = []
+    for student, expected_amount, amount_paid, fee_status in rows:
+        student.expected_amount = expected_amount
+        student.amount_paid = amount_paid
+        student.outstanding_amount = max(expected_amount - amount_paid, ZERO)
+        student.fee_status = fee_status
+        students.append(student)
+    return students
+
+
+def fee_breakdown_query(student, period_ids=()):
+    """
+    A student's fees term by term: one row per period with a payment, plus
+    the periods in `period_ids`, newest first, as
+    `(id, term, academic_year, expected_amount, amount_paid, fee_status)`.
+
+    Payments are summed per period in a grouped subquery that is left-joined
+    to the periods and to the fee for the student's class, so the whole
+    breakdown, ordered by period sequence, is a single statement.
+    """
+    paid = (
+        select(Payment.period_id, db.func.sum(Payment.amount_paid).label('amount_paid'))
+        .where(Payment.student_reg_number == student.reg_number)
+        .group_by(Payment.period_id)
+        .subquery()
+    )
+    expected_amount = db.func.coalesce(Fee.amount, 0)
+    amount_paid = db.func.coalesce(paid.c.amount_paid, 0)
+    return (
+        db.session.query(
+            Period.id,
+            Period.term,
+            Period.academic_year,
+            expected_amount.label('expected_amount'),
+            amount_paid.label('amount_paid'),
+            _fee_status(expected_amount, amount_paid).label('fee_status')
+        )
+        .outerjoin(paid, paid.c.period_id == Period.id)
+        .outerjoin(Fee, and_(Fee.period_id == Period.id, Fee.class_id == student.class_id))
+        .filter(or_(paid.c.period_id.isnot(None), Period.id.in_(list(period_ids))))
+        .order_by(Period.sequence.desc())
+    )
@@ -1,71 +1,228 @@
-def create_payment_receipt(receipt_details, school_details, filename="Payment_Receipt.pdf"):
+import io
+import os
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+from PIL import Image
+from reportlab import rl_config
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+# Define the smaller page size for the receipt
+RECEIPT_WIDTH = 4 * inch
+RECEIPT_HEIGHT = 6 * inch
+RECEIPT_SIZE = (RECEIPT_WIDTH, RECEIPT_HEIGHT)
+
+LOGO_PATH = os.path.join(os.path.dirname(__file__), 'static', 'images', 'alfurqan_logo.jpg')
+LOGO_WIDTH = 60
+# Logo pixels per point of printed width.
+LOGO_SCALE = 3
+
+# Name of the form XObject holding the header, drawn once per PDF.
+HEADER_FORM = 'receipt_header'
+
+_binary_streams_lock = threading.Lock()
+_binary_streams_depth = 0
+_saved_use_a85 = None
+
+
+@contextmanager
+def binary_streams():
+    """
+    Has reportlab write the streams of the PDFs rendered inside this block
+    as binary. ASCII85 only keeps files 7-bit clean, and without reportlab's
+    C accelerator encoding it was most of a receipt's render time.
+
+    reportlab takes this only from its global rl_config, as each page, form
+    and image is built, so the setting is switched for the block and put
+    back when the last overlapping block ends. Other PDFs in the process
+    keep reportlab's default.
+    """
+    global _binary_streams_depth, _saved_use_a85
+    with _binary_streams_lock:
+        if _binary_streams_depth == 0:
+            _saved_use_a85 = rl_config.useA85
+            rl_config.useA85 = 0
+        _binary_streams_depth += 1
+    try:
+        yield
+    finally:
+        with _binary_streams_lock:
+            _binary_streams_depth -= 1
+            if _binary_streams_depth == 0:
+                rl_config.useA85 = _saved_use_a85
+
+
+class _JpegImageReader(ImageReader):
+    """
+    ImageReader that hands reportlab its encoded JPEG, so each PDF embeds
+    the bytes as they are instead of re-compressing the decoded pixels.
+    """
+    def __init__(self, jpeg_bytes):
+        self._jpeg_bytes = jpeg_bytes
+        super().__init__(io.BytesIO(jpeg_bytes))
+
+    def jpeg_fh(self):
+        return io.BytesIO(self._jpeg_bytes)
+
+
+@lru_cache(maxsize=None)
+def load_logo(logo_path=LOGO_PATH):
+    """
+    Decodes and downscales the school logo once per process and reuses it
+    for every receipt.
+    Returns None if the image is missing or unreadable, so receipts are still
+    produced without it.
+    """
+    try:
+        with Image.open(logo_path) as image:
+            image = image.convert('RGB')
+            # Downscale to print resolution so each PDF embeds a small image.
+            image.thumbnail((LOGO_WIDTH * LOGO_SCALE, LOGO_WIDTH * LOGO_SCALE))
+    except OSError:
+        return None
+    jpeg = io.BytesIO()
+    image.save(jpeg, format='JPEG', quality=85)
+    logo = _JpegImageReader(jpeg.getvalue())
+    # Decoded pixels are cached by ImageReader; reportlab hashes them to name the image.
+    logo.getRGBData()
+    return logo
+
+
+def _fit_font_size(text, font, size, max_width, min_size=6):
+    """
+    Shrinks `size` until `text` fits in `max_width`, so long names stay on the receipt.
+    """
+    while size > min_size and stringWidth(text, font, size) > max_width:
+        size -= 0.5
+    return size
+
+
+def _draw_string_fitted(c, x, y, text, font, size, max_width):
+    c.setFont(font, _fit_font_size(text, font, size, max_width))
+    c.drawString(x, y, text)
+
+
+def _draw_header(c, school_details):
+    """
+    Header Section: Logo, School Name, Motto. Drawn into a form XObject the
+    first time, then stamped onto every further receipt in the same PDF.
+    """
+    if c.hasForm(HEADER_FORM):
+        c.doForm(HEADER_FORM)
+        return
+
+    c.beginForm(HEADER_FORM)
+    # Logo on top-left, keeping the image's aspect ratio.
+    logo = load_logo(school_details.get("logo_path", LOGO_PATH))
+    if logo is not None:
+        logo_width, logo_height = logo.getSize()
+        height = LOGO_WIDTH * logo_height / logo_width
+        c.drawImage(logo, 0.2 * inch, RECEIPT_HEIGHT - 0.3 * inch - height, width=LOGO_WIDTH, height=height)
+
+    # School Name and Motto from the school_details dict
+    text_x = 1.2 * inch
+    text_width = RECEIPT_WIDTH - text_x - 0.15 * inch
+    _draw_string_fitted(c, text_x, RECEIPT_HEIGHT - 0.5 * inch, school_details.get("name", ""), "Helvetica-Bold", 16, text_width)
+    _draw_string_fitted(c, text_x, RECEIPT_HEIGHT - 0.7 * inch, school_details.get("motto", ""), "Helvetica-Oblique", 10, text_width)
+
+    c.line(0.1 * inch, RECEIPT_HEIGHT - 1.2 * inch, RECEIPT_WIDTH - 0.1 * inch, RECEIPT_HEIGHT - 1.2 * inch)
+
+    # Title
+    c.setFont("Helvetica-Bold", 14)
+    c.drawCentredString(RECEIPT_WIDTH / 2, RECEIPT_HEIGHT - 1.5 * inch, "OFFICIAL RECEIPT")
+
+    # Signature Line
+    y_signatures = 1.0 * inch
+    c.setFont("Helvetica", 10)
+    c.line(0.2 * inch, y_signatures, RECEIPT_WIDTH - 0.2 * inch, y_signatures)
+    c.drawCentredString(RECEIPT_WIDTH / 2, y_signatures - 15, "Bursar/Cashier")
+    c.endForm()
+
+    c.doForm(HEADER_FORM)
+
+
+def draw_payment_receipt(c, receipt_details, school_details):
+    """
+    Draws one receipt on the current page of canvas `c` and ends the page.
+
+    `receipt_details` needs receipt_no, date, student_name, admission_no,
+    class and amount_paid. term, academic_year, balance, payment_method and
+    received_by are printed when present.
+    """
+    _draw_header(c, school_details)
+
+    # --- Receipt Number and Date ---
+    c.setFont("Helvetica", 10)
+    c.drawString(0.2 * inch, RECEIPT_HEIGHT - 1.8 * inch, f"Receipt No.: {receipt_details.get('receipt_no')}")
+    c.drawRightString(RECEIPT_WIDTH - 0.2 * inch, RECEIPT_HEIGHT - 1.8 * inch, f"Date: {receipt_details.get('date')}")
+
+    # --- Payment Details ---
+    y_position = RECEIPT_HEIGHT - 2.2 * inch
+    x_position_label = 0.2 * inch
+    x_position_value = 1.35 * inch
+    value_width = RECEIPT_WIDTH - x_position_value - 0.15 * inch
+
+    balance = receipt_details.get("balance")
+    # A list of tuples for the fields: (label, value)
+    fields = [
+        ("Student's Name:", receipt_details.get("student_name")),
+        ("Admission No.:", receipt_details.get("admission_no")),
+        ("Class:", receipt_details.get("class")),
+        ("Term:", receipt_details.get("term")),
+        ("Session:", receipt_details.get("academic_year")),
+        ("Amount Paid:", f"NGN {receipt_details.get('amount_paid'):,.2f}"),
+        ("Balance:", f"NGN {balance:,.2f}" if balance is not None else None),
+        ("Payment Method:", receipt_details.get("payment_method")),
+        ("Received By:", receipt_details.get("received_by")),
+    ]
+
+    for label, value in fields:
+        if value is None:
+            continue
+        c.setFont("Helvetica-Bold", 10)
+        c.drawString(x_position_label, y_position, label)
+        _draw_string_fitted(c, x_position_value, y_position, str(value), "Helvetica", 10, value_width)
+        y_position -= 16
+
+    c.showPage()
+
+
+def create_payment_receipt(receipt_details, school_details, output="Payment_Receipt.pdf"):
     """
     Generates a small, official Payment Receipt PDF document.
-    
+
     Args:
         receipt_details (dict): A dictionary containing all required information.
         school_details (dict): A dictionary with school name, motto, and logo path.
-        filename (str): The name of the output PDF file.
+        output: A file name or binary file object (e.g. io.BytesIO) to write the PDF to.
     """
-    try:
-        # Define the smaller page size for the receipt
-        receipt_width = 4 * inch
-        receipt_height = 6 * inch
-        receipt_size = (receipt_width, receipt_height)
-        
-        c = canvas.Canvas(filename, pagesize=receipt_size)
-        
-        # --- Header Section: Logo, School Name, Motto ---
-        # Logo on top-left. Using the school_details dict.
-        logo_path = school_details.get("logo_path")
-        c.drawImage(logo_path, 0.2 * inch, receipt_height - 0.8 * inch, width=60, height=60)
-        
-        # School Name and Motto from the school_details dict
-        c.setFont("Helvetica-Bold", 16)
-        c.drawString(1.5 * inch, receipt_height - 0.5 * inch, school_details.get("name"))
-        c.setFont("Helvetica-Oblique", 10)
-        c.drawString(1.5 * inch, receipt_height - 0.7 * inch, school_details.get("motto"))
-        
-        c.line(0.1 * inch, receipt_height - 1.2 * inch, receipt_width - 0.1 * inch, receipt_height - 1.2 * inch)
-        
-        # --- Title and Receipt Number ---
-        c.setFont("Helvetica-Bold", 14)
-        c.drawCentredString(receipt_width / 2, receipt_height - 1.5 * inch, "OFFICIAL RECEIPT")
-        
-        c.setFont("Helvetica", 10)
-        c.drawString(0.2 * inch, receipt_height - 1.8 * inch, f"Receipt No.: {receipt_details.get('receipt_no')}")
-        c.drawRightString(receipt_width - 0.2 * inch, receipt_height - 1.8 * inch, f"Date: {receipt_details.get('date')}")
-        
-        # --- Payment Details ---
-        y_position = receipt_height - 2.5 * inch
-        x_position_label = 0.2 * inch
-        x_position_value = 1.5 * inch
-
-        # A list of tuples for the fields: (label, value)
-        fields = [
-            ("Student's Name:", receipt_details.get("student_name")),
-            ("Admission No.:", receipt_details.get("admission_no")),
-            ("Class:", receipt_details.get("class")),
-            ("Amount Paid:", f"NGN {receipt_details.get('amount_paid'):,.2f}"),
-            ("Payment Method:", receipt_details.get("payment_method")),
-            ("Balance:", f"NGN {receipt_details.get('balance'):,.2f}"),
-        ]
-
-        for label, value in fields:
-            c.setFont("Helvetica-Bold", 10)
-            c.drawString(x_position_label, y_position, label)
-            c.setFont("Helvetica", 10)
-            c.drawString(x_position_value, y_position, str(value))
-            y_position -= 20
-
-        # --- Signature Line ---
-        y_signatures = 1.5 * inch
-        c.line(0.2 * inch, y_signatures, receipt_width - 0.2 * inch, y_signatures)
-        c.drawCentredString(receipt_width / 2, y_signatures - 15, "Bursar/Cashier")
-        
-        # Save the PDF
+    with binary_streams():
+        c = canvas.Canvas(output, pagesize=RECEIPT_SIZE, pageCompression=1)
+        c.setTitle(f"Receipt {receipt_details.get('receipt_no')}")
+        draw_payment_receipt(c, receipt_details, school_details)
         c.save()
-        print(f"Payment Receipt {receipt_details['receipt_no']} created successfully!")
+    return output
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
\ No newline at end of file
+
+def create_payment_receipts(receipts_details, school_details, output):
+    """
+    Writes one receipt per page for every dict in `receipts_details` into a
+    single PDF. The header is drawn once and shared by all pages. Returns the
+    number of receipts; nothing is written when there are none.
+    """
+    c = None
+    count = 0
+    with binary_streams():
+        for receipt_details in receipts_details:
+            if c is None:
+                c = canvas.Canvas(output, pagesize=RECEIPT_SIZE, pageCompression=1)
+                c.setTitle("Payment Receipts")
+            draw_payment_receipt(c, receipt_details, school_details)
+            count += 1
+        if c is not None:
+            c.save()
+    return count
@@ -0,0 +1,123 @@
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event, inspect
+
+from . import db
+from .cache import get_cache
+from .database import on_commit, transaction_info
+from .models import User
+
+# Changing either of these starts a new session version for the user.
+VERSIONED_FIELDS = ('role', 'password_hash')
+
+
+def _cache_key(user_id):
+    return f'user_identity:{user_id}'
+
+
+def _checked_key(user_id):
+    return f'user_version_checked:{user_id}'
+
+
+class UserIdentity(UserMixin):
+    """
+    What a request needs to know about the logged-in user: enough for role
+    checks, `current_user.username` in templates and recording who did what
+    by id. Built from the cache, so it is not attached to any session.
+    """
+    def __init__(self, id, username, role, session_version):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.session_version = session_version
+
+    def get_id(self):
+        return f'{self.id}:{self.session_version}'
+
+    def __repr__(self):
+        return f'<UserIdentity {self.username}>'
+
+
+def _identity_fields(user_id):
+    row = db.session.query(User.id, User.username, User.role, User.session_version) \
+        .filter(User.id == user_id).first()
+    return None if row is None else dict(row._mapping)
+
+
+def load_identity(session_id):
+    """
+    The `UserIdentity` for a Flask-Login session id ('<user id>:<session
+    version>'), or None if the user no longer exists or the session was
+    started before their role or password last changed. Sessions from
+    before versioning carry a bare user id and count as version 1.
+
+    Served from the cache for up to USER_CACHE_TTL seconds. With a shared
+    cache most requests run no query for the current user. With the
+    per-process memory cache, other workers' changes are not dropped from
+    this worker's copy, so the session version is checked against the
+    database (a primary-key lookup) at most once every
+    USER_VERSION_CHECK_INTERVAL seconds per user. A role or password change
+    made in another worker then signs the old sessions out within that
+    interval.
+    """
+    user_id, _, version = str(session_id).partition(':')
+    try:
+        user_id = int(user_id)
+        version = int(version or 1)
+    except ValueError:
+        return None
+
+    cache = get_cache()
+    check_interval = current_app.config['USER_VERSION_CHECK_INTERVAL']
+    fields = cache.get(_cache_key(user_id))
+    if fields is not None and not cache.shared and cache.get(_checked_key(user_id)) is None:
+        current_version = db.session.query(User.session_version).filter(User.id == user_id).scalar()
+        if current_version != fields['session_version']:
+            fields = None
+        elif check_interval:
+            cache.set(_checked_key(user_id), True, check_interval)
+    if fields is None:
+        fields = _identity_fields(user_id)
+        if fields is None:
+            return None
+        cache.set(_cache_key(user_id), fields, current_app.config['USER_CACHE_TTL'])
+        if not cache.shared and check_interval:
+            cache.set(_checked_key(user_id), True, check_interval)
+
+    if fields['session_version'] != version:
+        return None
+    return UserIdentity(**fields)
+
+
+def invalidate_identity(*user_ids):
+    """
+    Drops the cached identities of these users. With a shared cache every
+    worker sees it at once. With the per-process memory cache other workers
+    keep their copies, but `load_identity` stops using a copy once it finds
+    the session version out of date.
+    """
+    get_cache().delete(*[key for user_id in user_ids for key in (_cache_key(user_id), _checked_key(user_id))])
+
+
+def _before_flush(session, flush_context, instances):
+    """
+    Moves a user to a new session version when their role or password
+    changes, which signs out every session started with the old one.
+    """
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            on_commit(session, invalidate_identity, obj.id)
+
+    rehashed = transaction_info(session).get('rehashed_passwords', set())
+    for obj in session.dirty:
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        fields = VERSIONED_FIELDS if obj.id not in rehashed else ('role',)
+        if any(state.attrs[field].history.has_changes() for field in fields):
+            obj.session_version = (obj.session_version or 1) + 1
+            on_commit(session, invalidate_identity, obj.id)
+
+
+if not event.contains(db.session, 'before_flush', _before_flush):
+    event.listen(db.session, 'before_flush', _before_flush)
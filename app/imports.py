@@ -0,0 +1,453 @@
+import csv
+import io
+import os
+import re
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
+
+from . import db
+from .models import Student, Payment
+from .metrics import invalidate_metrics, STUDENTS, RECENT_STUDENTS, FEES_PAID
+from .reg_numbers import reserve_reg_numbers
+from .ledger import apply_payment_delta
+from .money import ZERO, to_naira
+from . import reference_data
+from .periods import ACADEMIC_YEAR, TERMS, ensure_period
+
+# Rows validated, numbered and inserted per transaction.
+IMPORT_CHUNK_SIZE = 500
+# Per-row errors kept for the summary; any beyond this are only counted.
+MAX_REPORTED_ERRORS = 200
+
+# Accepted header spellings for each student field, after normalizing.
+STUDENT_COLUMNS = {
+    'name': ('name', 'full_name', 'student_name'),
+    'dob': ('dob', 'date_of_birth', 'birth_date'),
+    'gender': ('gender', 'sex'),
+    'address': ('address',),
+    'phone': ('phone', 'phone_number', 'telephone'),
+    'email': ('email', 'email_address'),
+    'student_class': ('class', 'student_class', 'class_name'),
+    'term': ('term',),
+    'academic_year': ('academic_year', 'session', 'year'),
+}
+
+# Accepted header spellings for bank statement columns. Each line needs a
+# date, a credit amount and a reference and/or payer name to match on.
+STATEMENT_COLUMNS = {
+    'date': ('date', 'transaction_date', 'trans_date', 'value_date', 'posting_date'),
+    'amount': ('amount', 'credit', 'credit_amount', 'deposit', 'cr'),
+    'reference': ('reference', 'narration', 'description', 'details', 'remarks', 'memo'),
+    'payer': ('payer', 'name', 'payer_name', 'sender', 'depositor', 'customer_name'),
+}
+STATEMENT_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d-%b-%Y', '%d %b %Y', '%d/%m/%y')
+
+# Registration numbers as typed in transfer narrations: 'AAM/25/0001',
+# 'aam-25-1', 'AAM 25 0001'.
+REG_NUMBER_IN_TEXT = re.compile(r'\b([A-Za-z]{1,10})\s*[/\-_ ]\s*(\d{2})\s*[/\-_ ]\s*(\d{1,6})\b')
+# Longest run of words tried as a student name inside a narration.
+MAX_NAME_WORDS = 5
+
+
+class ImportFileError(Exception):
+    """
+    Raised when an uploaded file cannot be read at all (wrong type, missing
+    columns, missing optional dependency). Problems with single rows are
+    reported in the `ImportResult` instead.
+    """
+
+
+class ImportResult:
+    """
+    Outcome of an import: how many rows were written and which were rejected.
+    """
+    def __init__(self):
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def errors_truncated(self):
+        return self.error_count > len(self.errors)
+
+
+def _normalize_header(value):
+    return re.sub(r'[^a-z0-9]+', '_', str(value or '').strip().lower()).strip('_')
+
+
+def _cell(value):
+    """
+    Turns a CSV or spreadsheet cell into a stripped string. Spreadsheet dates
+    become YYYY-MM-DD and whole numbers lose their trailing '.0'.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    finally:
+        text.detach()
+
+
+def _xlsx_rows(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError as e:
+        raise ImportFileError("Reading .xlsx files needs the 'openpyxl' package. Upload a CSV file instead.") from e
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_table(upload, columns):
+    """
+    Streams the rows of an uploaded CSV or XLSX file as
+    `(line_number, {field: value})` pairs, one row at a time.
+
+    `columns` maps each field to the header spellings it may appear under.
+    Fields whose column is missing are absent from the dicts; blank rows are
+    skipped.
+    """
+    extension = os.path.splitext(upload.filename or '')[1].lower()
+    if extension == '.csv':
+        rows = _csv_rows(upload.stream)
+    elif extension == '.xlsx':
+        rows = _xlsx_rows(upload.stream)
+    else:
+        raise ImportFileError('Please upload a .csv or .xlsx file.')
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('The uploaded file is empty.')
+
+    positions = {}
+    normalized = [_normalize_header(value) for value in header]
+    for field, names in columns.items():
+        for index, name in enumerate(normalized):
+            if name in names:
+                positions[field] = index
+                break
+
+    def generate():
+        for line, row in enumerate(rows, start=2):
+            values = {field: _cell(row[index]) if index < len(row) else '' for field, index in positions.items()}
+            if any(values.values()):
+                yield line, values
+
+    return positions, generate()
+
+
+def _validate_student(values, class_names):
+    """
+    Returns a list of problems with one student row (empty if it is valid).
+    Uses the same rules as the registration form.
+    """
+    problems = [f'{field} is required' for field in STUDENT_COLUMNS if not values.get(field)]
+    if problems:
+        return problems
+
+    for field, value in values.items():
+        # student_class is not a column; it is checked against the class list below.
+        column = Student.__table__.c.get(field)
+        length = getattr(column.type, 'length', None) if column is not None else None
+        if length and len(value) > length:
+            problems.append(f'{field} is longer than {length} characters')
+
+    try:
+        datetime.strptime(values['dob'], '%Y-%m-%d')
+    except ValueError:
+        problems.append(f"dob '{values['dob']}' is not a YYYY-MM-DD date")
+    if values['student_class'] not in class_names:
+        problems.append(f"class '{values['student_class']}' does not exist")
+    if values['term'] not in TERMS:
+        problems.append(f"term must be one of {', '.join(TERMS)}")
+    match = ACADEMIC_YEAR.match(values['academic_year'])
+    if not match or int(match.group(2)) != int(match.group(1)) + 1:
+        problems.append(f"academic_year '{values['academic_year']}' must look like 2025/2026")
+    return problems
+
+
+def import_students(upload):
+    """
+    Enrolls every valid row of an uploaded student list.
+
+    Rows are handled IMPORT_CHUNK_SIZE at a time: each chunk is validated,
+    given a block of registration numbers with a single reservation and
+    written with one executemany INSERT, then committed. Only one chunk is
+    held in memory, so file size does not matter. Invalid rows are skipped
+    and listed in the returned `ImportResult`.
+    """
+    positions, rows = read_table(upload, STUDENT_COLUMNS)
+    missing = [field for field in STUDENT_COLUMNS if field not in positions]
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(missing)}.")
+
+    class_ids = reference_data.get_reference_data().class_ids
+    admission_date = date.today()
+    students = Student.__table__
+    result = ImportResult()
+
+    try:
+        while True:
+            chunk = list(islice(rows, IMPORT_CHUNK_SIZE))
+            if not chunk:
+                break
+
+            valid = []
+            for line, values in chunk:
+                problems = _validate_student(values, class_ids)
+                if problems:
+                    result.add_error(line, '; '.join(problems))
+                else:
+                    valid.append(values)
+            if not valid:
+                continue
+
+            for values, reg_number in zip(valid, reserve_reg_numbers(len(valid))):
+                values['reg_number'] = reg_number
+                values['class_id'] = class_ids[values.pop('student_class')]
+                values['dob'] = datetime.strptime(values['dob'], '%Y-%m-%d').date()
+                values['admission_date'] = admission_date
+            # Search index triggers fire per row inside this statement.
+            db.session.execute(students.insert(), valid)
+            db.session.commit()
+            result.imported += len(valid)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if result.imported:
+            # Core inserts bypass the session events that keep the dashboard fresh.
+            invalidate_metrics(STUDENTS, RECENT_STUDENTS)
+    return result
+
+
+def _parse_amount(text):
+    cleaned = re.sub(r'[^0-9.\-]', '', text.replace('NGN', ''))
+    try:
+        return to_naira(cleaned)
+    except ValueError:
+        return None
+
+
+def _parse_statement_date(text):
+    for date_format in STATEMENT_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _name_key(text):
+    """
+    Order-insensitive key for a person's name: 'Musa  Aliyu' and 'ALIYU MUSA' match.
+    """
+    return tuple(sorted(re.findall(r'[a-z]+', text.lower())))
+
+
+class StudentMatcher:
+    """
+    In-memory indexes of every student by registration number and by name,
+    built with one query per import so statement lines are matched without
+    touching the database.
+    """
+    def __init__(self):
+        self.by_reg_number = {}
+        self.by_name = defaultdict(set)
+        self.names = {}
+        for reg_number, name in db.session.query(Student.reg_number, Student.name):
+            self.by_reg_number[reg_number.upper()] = reg_number
+            self.by_name[_name_key(name)].add(reg_number)
+            self.names[reg_number] = name
+
+    def _reg_numbers_in(self, text):
+        found = set()
+        for prefix, year, number in REG_NUMBER_IN_TEXT.findall(text):
+            reg_number = self.by_reg_number.get(f'{prefix.upper()}/{year}/{int(number):04d}')
+            if reg_number:
+                found.add(reg_number)
+        # Registration numbers in other formats, as whole words.
+        for token in re.findall(r'[A-Za-z0-9/\-]+', text):
+            reg_number = self.by_reg_number.get(token.upper())
+            if reg_number:
+                found.add(reg_number)
+        return found
+
+    def _names_in(self, text):
+        words = re.findall(r'[a-z]+', text.lower())
+        found = set()
+        for size in range(2, MAX_NAME_WORDS + 1):
+            for start in range(len(words) - size + 1):
+                found |= self.by_name.get(tuple(sorted(words[start:start + size])), set())
+        return found
+
+    def match(self, reference, payer):
+        """
+        Returns the set of students a statement line could belong to.
+        A registration number in the reference wins; otherwise the payer
+        name, then any student name written in the reference, is used.
+        """
+        candidates = self._reg_numbers_in(reference)
+        if candidates:
+            return candidates
+        if payer:
+            candidates = set(self.by_name.get(_name_key(payer), set()))
+            if candidates:
+                return candidates
+        return self._names_in(f'{reference} {payer}')
+
+
+class StatementImportResult:
+    """
+    Reconciliation summary of a bank statement import.
+    """
+    def __init__(self):
+        self.matched = 0
+        self.matched_amount = ZERO
+        self.duplicates = []
+        self.ambiguous = []
+        self.unmatched = []
+        self.skipped = 0
+        self.errors = []
+
+
+def _existing_payment_counts(lines):
+    """
+    How many identical payments (student, date, amount) are already recorded
+    for a chunk of matched lines, fetched with a single query.
+    """
+    reg_numbers = {line['reg_number'] for line in lines}
+    dates = {line['payment_date'] for line in lines}
+    rows = db.session.query(Payment.student_reg_number, Payment.payment_date, Payment.amount_paid).filter(
+        Payment.student_reg_number.in_(reg_numbers),
+        Payment.payment_date.in_(dates)
+    )
+    return Counter(tuple(row) for row in rows)
+
+
+def import_statement(upload, academic_year, term, user, dry_run=False):
+    """
+    Records the credits of an uploaded bank statement as payments for
+    `academic_year` and `term`.
+
+    Each line is matched to a student through `StudentMatcher`. Lines that
+    match exactly one student are inserted IMPORT_CHUNK_SIZE at a time with
+    one executemany INSERT per chunk, recorded by `user`. Lines already
+    recorded (same student, date and amount) before this import are
+    reported as duplicates, so importing a statement twice is harmless,
+    while identical lines within one statement are all recorded. Ambiguous and unmatched
+    lines are listed for manual entry. With `dry_run` nothing is written.
+    """
+    positions, rows = read_table(upload, STATEMENT_COLUMNS)
+    if 'date' not in positions or 'amount' not in positions:
+        raise ImportFileError('The statement needs a date column and an amount (credit) column.')
+    if 'reference' not in positions and 'payer' not in positions:
+        raise ImportFileError('The statement needs a reference/narration column or a payer name column.')
+
+    matcher = StudentMatcher()
+    payments = Payment.__table__
+    result = StatementImportResult()
+    # (student, date, amount) of the payments this import has inserted so far.
+    inserted = Counter()
+
+    try:
+        period_id = reference_data.period_id(academic_year, term) if dry_run else ensure_period(academic_year, term)
+        while True:
+            chunk = list(islice(rows, IMPORT_CHUNK_SIZE))
+            if not chunk:
+                break
+
+            matched = []
+            for line, values in chunk:
+                reference = values.get('reference', '')
+                payer = values.get('payer', '')
+                amount = _parse_amount(values['amount'])
+                payment_date = _parse_statement_date(values['date'])
+                if amount is None or payment_date is None:
+                    result.errors.append((line, f"unreadable date '{values['date']}' or amount '{values['amount']}'"))
+                    continue
+                if amount <= 0:
+                    # Debits and zero lines are not fee payments.
+                    result.skipped += 1
+                    continue
+
+                entry = {'line': line, 'reference': reference, 'payer': payer, 'amount': amount, 'payment_date': payment_date}
+                candidates = matcher.match(reference, payer)
+                if len(candidates) == 1:
+                    entry['reg_number'] = candidates.pop()
+                    entry['name'] = matcher.names[entry['reg_number']]
+                    matched.append(entry)
+                elif candidates:
+                    entry['candidates'] = sorted(f'{reg} ({matcher.names[reg]})' for reg in candidates)
+                    result.ambiguous.append(entry)
+                else:
+                    result.unmatched.append(entry)
+
+            if not matched:
+                continue
+
+            existing = _existing_payment_counts(matched)
+            # Earlier chunks are already committed; their rows come from this
+            # file, so they must not count as duplicates of it.
+            existing.subtract(inserted)
+            new_payments = []
+            for entry in matched:
+                key = (entry['reg_number'], entry['payment_date'], entry['amount'])
+                if existing[key] > 0:
+                    existing[key] -= 1
+                    result.duplicates.append(entry)
+                    continue
+                new_payments.append({
+                    'student_reg_number': entry['reg_number'],
+                    'amount_paid': entry['amount'],
+                    'period_id': period_id,
+                    'payment_date': entry['payment_date'],
+                    'recorded_by': user.id,
+                })
+
+            if new_payments and not dry_run:
+                db.session.execute(payments.insert(), new_payments)
+                # Core inserts skip the ledger's flush listener, so apply the
+                # balance changes here, once per student, in the same transaction.
+                deltas = defaultdict(Decimal)
+                for payment in new_payments:
+                    deltas[payment['student_reg_number']] += payment['amount_paid']
+                connection = db.session.connection()
+                for reg_number, delta in deltas.items():
+                    apply_payment_delta(connection, reg_number, period_id, delta)
+                db.session.commit()
+                inserted.update(
+                    (payment['student_reg_number'], payment['payment_date'], payment['amount_paid'])
+                    for payment in new_payments
+                )
+
+            result.matched += len(new_payments)
+            result.matched_amount += sum(payment['amount_paid'] for payment in new_payments)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if result.matched and not dry_run:
+            invalidate_metrics(FEES_PAID, RECENT_STUDENTS)
+    return result
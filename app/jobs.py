@@ -0,0 +1,251 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from . import replica
+from .models import ReportJob
+from .reports import report_query, write_fee_report
+
+# Job states, stored in report_jobs.status
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Minimum seconds between progress writes from a running job.
+PROGRESS_INTERVAL = 1.0
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Flask app used inside pool processes, created by _init_worker.
+_worker_app = None
+
+
+def _init_worker():
+    """
+    Runs once in each pool process. The pool uses 'spawn', so every process
+    builds its own app and database engine instead of sharing the parent's
+    connections.
+    """
+    global _worker_app
+    from . import create_app
+    _worker_app = create_app()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=current_app.config['REPORT_JOB_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        return _executor
+
+
+def reports_dir(app):
+    return os.path.join(app.instance_path, 'reports')
+
+
+def _stale(cutoff):
+    return (
+        ReportJob.status.in_((QUEUED, RUNNING)),
+        or_(ReportJob.heartbeat_at < cutoff, ReportJob.heartbeat_at.is_(None))
+    )
+
+
+def recover_jobs():
+    """
+    Queues again the jobs whose process has gone quiet and hands them to
+    this process's pool. A running job stamps heartbeat_at every
+    REPORT_JOB_HEARTBEAT_INTERVAL seconds, so one silent for
+    REPORT_JOB_STALE_AFTER seconds lost its process to a deploy or crash.
+    The same goes for a queued job that no pool has picked up in that time.
+
+    Runs on every enqueue and status poll. The conditional update hands each
+    stale job to one web worker, and the atomic claim in run_report_job
+    stops it running twice.
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=current_app.config['REPORT_JOB_STALE_AFTER'])
+    stale_ids = [job_id for (job_id,) in db.session.query(ReportJob.id).filter(*_stale(cutoff))]
+
+    revived = []
+    for job_id in stale_ids:
+        if db.session.execute(
+            update(ReportJob)
+            .where(ReportJob.id == job_id, *_stale(cutoff))
+            .values(status=QUEUED, progress=0, started_at=None, heartbeat_at=now)
+        ).rowcount:
+            revived.append(job_id)
+
+    if revived:
+        db.session.commit()
+        executor = _get_executor()
+        for job_id in revived:
+            executor.submit(run_report_job, job_id)
+
+
+def purge_report_jobs():
+    """
+    Deletes the finished and failed jobs that ended more than
+    REPORT_JOB_RETENTION_DAYS ago, with their PDFs, and returns how many
+    there were. Runs on every enqueue and from `flask purge-report-jobs`.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['REPORT_JOB_RETENTION_DAYS'])
+    expired = db.session.query(ReportJob.id, ReportJob.result_path).filter(
+        ReportJob.status.in_((DONE, FAILED)),
+        ReportJob.finished_at < cutoff
+    ).all()
+    if not expired:
+        return 0
+
+    db.session.execute(delete(ReportJob).where(ReportJob.id.in_([job_id for job_id, _ in expired])))
+    db.session.commit()
+    # Rows go first: the download view checks the file exists before sending it.
+    for _, path in expired:
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return len(expired)
+
+
+def enqueue_report(report_type, student_class, academic_year, term, user):
+    """
+    Records a report request and hands it to the process pool. Returns the
+    new `ReportJob` straight away; the PDF is rendered in the background.
+    """
+    recover_jobs()
+    purge_report_jobs()
+
+    job = ReportJob(
+        id=uuid.uuid4().hex,
+        report_type=report_type,
+        student_class=student_class,
+        academic_year=academic_year,
+        term=term,
+        status=QUEUED,
+        progress=0,
+        requested_by=user.id,
+        heartbeat_at=datetime.utcnow()
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    _get_executor().submit(run_report_job, job.id)
+    return job
+
+
+def _heartbeat(app, job_id, stop):
+    """
+    Stamps heartbeat_at on a running job until `stop` is set, so
+    recover_jobs can tell it from a job whose process died.
+    """
+    with app.app_context():
+        while not stop.wait(app.config['REPORT_JOB_HEARTBEAT_INTERVAL']):
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(
+                        update(ReportJob.__table__)
+                        .where(ReportJob.id == job_id, ReportJob.status == RUNNING)
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+            except SQLAlchemyError as e:
+                app.logger.warning('Heartbeat for report job %s failed: %s', job_id, e)
+
+
+def run_report_job(job_id):
+    """
+    Claims one queued report and renders it. Runs inside a pool process.
+    """
+    app = _worker_app
+    with app.app_context():
+        # Claim the job atomically so it only ever runs once.
+        claimed = db.session.execute(
+            update(ReportJob)
+            .where(ReportJob.id == job_id, ReportJob.status == QUEUED)
+            .values(status=RUNNING, started_at=datetime.utcnow(), heartbeat_at=datetime.utcnow(), progress=0)
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(app, job_id, stop), daemon=True)
+    heartbeat.start()
+    try:
+        _render_report_job(app, job_id)
+    finally:
+        stop.set()
+        heartbeat.join()
+
+
+def _render_report_job(app, job_id):
+    with app.app_context():
+
+        job = db.session.get(ReportJob, job_id)
+        report_args = (job.report_type, job.student_class, job.academic_year, job.term)
+        requested_by = job.requester.username
+        # The report rows come from the replica when there is one. The job's
+        # own row is only written from here on, so it stays on the primary.
+        replica.use_replica(pin_on_write=False)
+        os.makedirs(reports_dir(app), exist_ok=True)
+        path = os.path.join(reports_dir(app), f'{job.id}.pdf')
+        partial_path = path + '.part'
+        last_write = [0.0]
+
+        def progress(rows_done):
+            now = time.monotonic()
+            if now - last_write[0] >= PROGRESS_INTERVAL:
+                last_write[0] = now
+                job.progress = rows_done
+                db.session.commit()
+
+        try:
+            job.total = report_query(*report_args).count()
+            db.session.commit()
+
+            with open(partial_path, 'wb') as output:
+                job.progress = write_fee_report(
+                    output,
+                    *report_args,
+                    subtitle=f"Generated {datetime.now().strftime('%Y-%m-%d %H:%M')} by {requested_by}",
+                    progress=progress
+                )
+            os.replace(partial_path, path)
+
+            job.status = DONE
+            job.result_path = path
+        except Exception as e:
+            db.session.rollback()
+            job.status = FAILED
+            job.error = str(e)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def init_app(app):
+    """
+    Registers the report queue's CLI commands on the app.
+    """
+    @app.cli.command('purge-report-jobs')
+    def purge_report_jobs_command():
+        """Delete report jobs and PDFs older than REPORT_JOB_RETENTION_DAYS."""
+        count = purge_report_jobs()
+        click.echo(f'Deleted {count} old report jobs.')
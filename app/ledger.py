@@ -0,0 +1,229 @@
+from collections import defaultdict
+from decimal import Decimal
+
+import click
+from sqlalchemy import and_, delete, event, insert, inspect, select, update
+
+from . import db
+from .database import upsert
+from .money import ZERO, to_naira
+from .models import Student, Payment, Fee, StudentTermBalance
+
+# The ledger is written with Core statements so it can run inside a flush.
+balances = StudentTermBalance.__table__
+
+
+def _balance_key(reg_number, period_id):
+    return and_(
+        balances.c.student_reg_number == reg_number,
+        balances.c.period_id == period_id
+    )
+
+
+def _expected_amount_for_balance():
+    """
+    Correlated subquery: the fee for a ledger row's period and the student's current class.
+    """
+    return db.func.coalesce(
+        select(Fee.amount)
+        .join(Student, Student.class_id == Fee.class_id)
+        .where(
+            Student.reg_number == balances.c.student_reg_number,
+            Fee.period_id == balances.c.period_id
+        )
+        .scalar_subquery(),
+        0
+    )
+
+
+def _insert_balance(connection, reg_number, period_id, delta):
+    """
+    Creates the ledger row for a period from the source tables. The flush has
+    already written the payment, so the computed total includes it.
+    """
+    amount_paid = connection.execute(
+        select(db.func.coalesce(db.func.sum(Payment.amount_paid), 0)).where(
+            Payment.student_reg_number == reg_number,
+            Payment.period_id == period_id
+        )
+    ).scalar()
+    expected_amount = connection.execute(
+        select(Fee.amount)
+        .join(Student, Student.class_id == Fee.class_id)
+        .where(
+            Student.reg_number == reg_number,
+            Fee.period_id == period_id
+        )
+    ).scalar() or ZERO
+
+    values = dict(
+        student_reg_number=reg_number,
+        period_id=period_id,
+        expected_amount=expected_amount,
+        amount_paid=amount_paid
+    )
+
+    # A concurrent first payment for the same period may have created the
+    # row in the meantime; fall back to applying our delta to it.
+    upsert(
+        connection, balances, values,
+        index_elements=[balances.c.student_reg_number, balances.c.period_id],
+        set_={'amount_paid': balances.c.amount_paid + delta}
+    )
+
+
+def apply_payment_delta(connection, reg_number, period_id, delta):
+    """
+    Adds `delta` to the amount paid for one student and period, creating the
+    ledger row on the first payment.
+    """
+    result = connection.execute(
+        update(balances)
+        .where(_balance_key(reg_number, period_id))
+        .values(amount_paid=balances.c.amount_paid + delta)
+    )
+    if result.rowcount == 0:
+        _insert_balance(connection, reg_number, period_id, delta)
+
+
+def refresh_expected_amounts(connection, criteria):
+    """
+    Recomputes `expected_amount` for the ledger rows matching `criteria`.
+    """
+    connection.execute(
+        update(balances)
+        .where(criteria)
+        .values(expected_amount=_expected_amount_for_balance())
+    )
+
+
+def _previous(obj, attr):
+    """
+    The value an attribute had before the current flush.
+    """
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attr)
+
+
+def _payment_key(payment, previous=False):
+    get = (lambda attr: _previous(payment, attr)) if previous else (lambda attr: getattr(payment, attr))
+    return (get('student_reg_number'), get('period_id')), to_naira(get('amount_paid'))
+
+
+def _fee_period(fee, previous=False):
+    get = (lambda attr: _previous(fee, attr)) if previous else (lambda attr: getattr(fee, attr))
+    return get('class_id'), get('period_id')
+
+
+def _after_flush(session, flush_context):
+    """
+    Keeps the ledger in step with the rows written by this flush. Runs on the
+    session's own connection, so ledger updates commit or roll back with the
+    payment, fee or student change that caused them.
+    """
+    deltas = defaultdict(Decimal)
+    fee_periods = set()
+    reclassed_students = set()
+
+    for obj in session.new:
+        if isinstance(obj, Payment):
+            key, amount = _payment_key(obj)
+            deltas[key] += amount
+        elif isinstance(obj, Fee):
+            fee_periods.add(_fee_period(obj))
+
+    for obj in session.deleted:
+        if isinstance(obj, Payment):
+            key, amount = _payment_key(obj, previous=True)
+            deltas[key] -= amount
+        elif isinstance(obj, Fee):
+            fee_periods.add(_fee_period(obj, previous=True))
+
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, Payment):
+            old_key, old_amount = _payment_key(obj, previous=True)
+            new_key, new_amount = _payment_key(obj)
+            deltas[old_key] -= old_amount
+            deltas[new_key] += new_amount
+        elif isinstance(obj, Fee):
+            fee_periods.add(_fee_period(obj, previous=True))
+            fee_periods.add(_fee_period(obj))
+        elif isinstance(obj, Student):
+            if inspect(obj).attrs.class_id.history.has_changes():
+                reclassed_students.add(obj.reg_number)
+
+    if not (deltas or fee_periods or reclassed_students):
+        return
+
+    connection = session.connection()
+    for (reg_number, period_id), delta in deltas.items():
+        if delta:
+            apply_payment_delta(connection, reg_number, period_id, delta)
+
+    for class_id, period_id in fee_periods:
+        refresh_expected_amounts(connection, and_(
+            balances.c.period_id == period_id,
+            balances.c.student_reg_number.in_(
+                select(Student.reg_number).where(Student.class_id == class_id)
+            )
+        ))
+
+    if reclassed_students:
+        refresh_expected_amounts(connection, balances.c.student_reg_number.in_(reclassed_students))
+
+
+if not event.contains(db.session, 'after_flush', _after_flush):
+    event.listen(db.session, 'after_flush', _after_flush)
+
+
+def rebuild_balances():
+    """
+    Recomputes the whole ledger from `payments` and `fees` and commits.
+    Returns the number of ledger rows written.
+    """
+    totals = (
+        select(
+            Payment.student_reg_number,
+            Payment.period_id,
+            db.func.sum(Payment.amount_paid).label('amount_paid')
+        )
+        .group_by(Payment.student_reg_number, Payment.period_id)
+        .subquery()
+    )
+    source = (
+        select(
+            totals.c.student_reg_number,
+            totals.c.period_id,
+            db.func.coalesce(Fee.amount, 0),
+            totals.c.amount_paid
+        )
+        .select_from(totals)
+        .join(Student, Student.reg_number == totals.c.student_reg_number)
+        .outerjoin(Fee, and_(
+            Fee.class_id == Student.class_id,
+            Fee.period_id == totals.c.period_id
+        ))
+    )
+
+    db.session.execute(delete(balances))
+    db.session.execute(insert(balances).from_select(
+        ['student_reg_number', 'period_id', 'expected_amount', 'amount_paid'],
+        source
+    ))
+    db.session.commit()
+    return db.session.query(StudentTermBalance).count()
+
+
+def init_app(app):
+    """
+    Registers the ledger's CLI commands on the app.
+    """
+    @app.cli.command('rebuild-balances')
+    def rebuild_balances_command():
+        """Recompute the student_term_balances ledger from scratch."""
+        count = rebuild_balances()
+        click.echo(f'Rebuilt {count} student balance rows.')
@@ -0,0 +1,126 @@
+from flask import current_app
+from sqlalchemy import event
+
+from . import db, get_current_school_period
+from .cache import get_cache
+from .database import on_commit
+from .models import User, Student, Teacher, Payment, Fee, Class
+from .fee_status import fee_status_query
+from .money import to_kobo, from_kobo
+
+# Cache keys for each dashboard metric.
+STUDENTS = 'dashboard:total_students'
+FEES_PAID = 'dashboard:total_fees_paid'
+TEACHERS = 'dashboard:total_teachers'
+OFFICERS = 'dashboard:total_officers'
+RECENT_STUDENTS = 'dashboard:recent_students'
+
+ALL_METRICS = (STUDENTS, FEES_PAID, TEACHERS, OFFICERS, RECENT_STUDENTS)
+
+RECENT_STUDENTS_LIMIT = 5
+
+
+def _recent_students(period_id):
+    """
+    The newest students with their fee status for the current term, as plain dicts.
+    """
+    rows = fee_status_query(Student.query, period_id) \
+        .order_by(Student.admission_date.desc()).limit(RECENT_STUDENTS_LIMIT).all()
+    return [
+        {
+            'name': student.name,
+            'reg_number': student.reg_number,
+            'student_class': student.student_class,
+            'fee_status': fee_status,
+        }
+        for student, _, _, fee_status in rows
+    ]
+
+
+_LOADERS = {
+    STUDENTS: lambda: db.session.query(Student).count(),
+    # Kept in kobo so the cached value is a plain integer.
+    FEES_PAID: lambda: to_kobo(db.session.query(db.func.sum(Payment.amount_paid)).scalar() or 0),
+    TEACHERS: lambda: db.session.query(Teacher).count(),
+    OFFICERS: lambda: db.session.query(User).filter_by(role='officer').count(),
+}
+
+
+def dashboard_metrics():
+    """
+    Returns the admin dashboard figures, served from the cache when possible.
+    Only missing entries are recomputed, so in the steady state the
+    dashboard runs no aggregate queries at all.
+    """
+    cache = get_cache()
+    ttl = current_app.config['METRICS_CACHE_TTL']
+    values = dict(zip(ALL_METRICS, cache.get_many(ALL_METRICS)))
+
+    for key, load in _LOADERS.items():
+        if values[key] is None:
+            values[key] = load()
+            cache.set(key, values[key], ttl)
+
+    # The recent list also depends on the term, so it is stored with it.
+    period = get_current_school_period().id
+    recent = values[RECENT_STUDENTS]
+    if recent is None or recent['period'] != period:
+        recent = {'period': period, 'students': _recent_students(period)}
+        cache.set(RECENT_STUDENTS, recent, ttl)
+
+    return {
+        'total_students': values[STUDENTS],
+        'total_fees_paid': from_kobo(values[FEES_PAID]),
+        'total_teachers': values[TEACHERS],
+        'total_officers': values[OFFICERS],
+        'students': recent['students'],
+    }
+
+
+def invalidate_metrics(*keys):
+    """
+    Drops cached dashboard metrics (all of them if no keys are given). Code
+    that writes with Core statements, which skip the session events below,
+    calls this after committing.
+    """
+    get_cache().delete(*(keys or ALL_METRICS))
+
+
+def _stale_metrics(session):
+    stale = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Student):
+            stale.update((STUDENTS, RECENT_STUDENTS))
+        elif isinstance(obj, Payment):
+            stale.update((FEES_PAID, RECENT_STUDENTS))
+        elif isinstance(obj, Teacher):
+            stale.add(TEACHERS)
+        elif isinstance(obj, User):
+            stale.add(OFFICERS)
+        elif isinstance(obj, Fee):
+            stale.add(RECENT_STUDENTS)
+
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, Payment):
+            stale.update((FEES_PAID, RECENT_STUDENTS))
+        elif isinstance(obj, (Student, Fee, Class)):
+            # A renamed class changes the names shown in the recent list.
+            stale.add(RECENT_STUDENTS)
+        elif isinstance(obj, User):
+            stale.add(OFFICERS)
+    return stale
+
+
+def _after_flush(session, flush_context):
+    """
+    Notes which dashboard metrics the flushed changes affect.
+    """
+    stale = _stale_metrics(session)
+    if stale:
+        on_commit(session, invalidate_metrics, *stale)
+
+
+if not event.contains(db.session, 'after_flush', _after_flush):
+    event.listen(db.session, 'after_flush', _after_flush)
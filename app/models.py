@@ -1,5 +1,10 @@
+from datetime import datetime
 from flask_login import UserMixin
-from . import db, bcrypt
+from sqlalchemy.orm import object_session
+from . import db
+from .database import transaction_info
+from .money import Money
+from .passwords import hash_password, verify_password
 
 class User(db.Model, UserMixin):
     """
@@ -11,7 +16,9 @@ class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
-    role = db.Column(db.String(64), default='user', nullable=False)
+    role = db.Column(db.String(64), default='user', nullable=False, index=True)
+    # Bumped whenever the role or password changes; see app/identity.py.
+    session_version = db.Column(db.Integer, default=1, nullable=False)
 
     @property
     def password(self):
@@ -21,11 +28,26 @@ class User(db.Model, UserMixin):
     @password.setter
     def password(self, password):
         """Hashes the password before storing it"""
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        """Checks if the provided password matches the stored hash"""
-        return bcrypt.check_password_hash(self.password_hash, password)
+        """
+        Checks the password against the stored hash, whatever scheme made it.
+        A hash from an older scheme or a lower cost is replaced with a fresh
+        one, saved by the session's next commit.
+        """
+        matches, new_hash = verify_password(password, self.password_hash)
+        if matches and new_hash:
+            self.password_hash = new_hash
+            session = object_session(self)
+            if session is not None:
+                # Same password, so existing logins stay valid (see app/identity.py).
+                transaction_info(session).setdefault('rehashed_passwords', set()).add(self.id)
+        return matches
+
+    def get_id(self):
+        """Flask-Login session id: the user id and the current session version"""
+        return f'{self.id}:{self.session_version or 1}'
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -38,19 +60,32 @@ class Student(db.Model):
     
     reg_number = db.Column(db.String(20), primary_key=True, nullable=False)
     name = db.Column(db.String(100), nullable=False)
-    dob = db.Column(db.String(10), nullable=False)
+    dob = db.Column(db.Date, nullable=False)
     gender = db.Column(db.String(10), nullable=False)
     address = db.Column(db.String(200))
     phone = db.Column(db.String(20))
     email = db.Column(db.String(100))
-    student_class = db.Column(db.String(50), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), nullable=False)
     term = db.Column(db.String(50), nullable=False)
     academic_year = db.Column(db.String(10), nullable=False)
-    admission_date = db.Column(db.String(10), nullable=False)
+    admission_date = db.Column(db.Date, nullable=False, index=True)
     
+    # Class filters in the student list and reports are served by the
+    # (class_id, name, reg_number) index, which also matches their ordering.
+    __table_args__ = (
+        db.Index('ix_students_class_name', 'class_id', 'name', 'reg_number'),
+        db.Index('ix_students_term', 'term'),
+    )
+
     # Define a relationship with the Payment model.
     # `back_populates` links the two ends of the relationship.
     payments = db.relationship('Payment', back_populates='student', lazy=True)
+    school_class = db.relationship('Class', lazy='joined', innerjoin=True)
+
+    @property
+    def student_class(self):
+        """Name of the student's class"""
+        return self.school_class.name if self.school_class else None
 
     def __repr__(self):
         return f'<Student {self.reg_number} - {self.name}>'
@@ -63,9 +98,16 @@ class Teacher(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    class_taught = db.Column(db.String(50))
+    class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), index=True)
     email = db.Column(db.String(100), unique=True, nullable=False)
     phone = db.Column(db.String(20))
+
+    school_class = db.relationship('Class', lazy='joined')
+
+    @property
+    def class_taught(self):
+        """Name of the class the teacher takes, if any"""
+        return self.school_class.name if self.school_class else None
     
     def __repr__(self):
         return f'<Teacher {self.name}>'
@@ -78,16 +120,34 @@ class Payment(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     student_reg_number = db.Column(db.String(20), db.ForeignKey('students.reg_number'), nullable=False)
-    amount_paid = db.Column(db.Float, nullable=False)
-    term = db.Column(db.String(50), nullable=False)
-    academic_year = db.Column(db.String(10), nullable=False)
-    payment_date = db.Column(db.String(10), nullable=False)
+    amount_paid = db.Column(Money, nullable=False)
+    period_id = db.Column(db.Integer, db.ForeignKey('periods.id'), nullable=False)
+    payment_date = db.Column(db.Date, nullable=False)
     recorded_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
+    # Per-student history and per-period totals are the two hot payment lookups;
+    # the date index serves the /payments ledger's date range and cashier filters.
+    __table_args__ = (
+        db.Index('ix_payments_student_period', 'student_reg_number', 'period_id'),
+        db.Index('ix_payments_period', 'period_id'),
+        db.Index('ix_payments_date_recorded_by', 'payment_date', 'recorded_by'),
+    )
+
     # Define a relationship to the student who made the payment.
     student = db.relationship('Student', back_populates='payments')
     # Define a relationship to the user who recorded the payment.
     recorder = db.relationship('User', backref='payments_recorded')
+    period = db.relationship('Period', lazy='joined', innerjoin=True)
+
+    @property
+    def term(self):
+        """Term the payment is for"""
+        return self.period.term
+
+    @property
+    def academic_year(self):
+        """Academic year the payment is for"""
+        return self.period.academic_year
 
     def __repr__(self):
         return f'<Payment {self.id} for {self.student_reg_number}>'
@@ -96,28 +156,106 @@ class Payment(db.Model):
 class Fee(db.Model):
     """
     Represents the fee amount for a specific class, term, and academic year.
-    This replaces the hardcoded FEE_STRUCTURE dictionary.
     """
     __tablename__ = 'fees'
 
     id = db.Column(db.Integer, primary_key=True)
-    student_class = db.Column(db.String(50), nullable=False)
-    term = db.Column(db.String(50), nullable=False)
-    academic_year = db.Column(db.String(50), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('classes.id'), nullable=False)
+    period_id = db.Column(db.Integer, db.ForeignKey('periods.id'), nullable=False)
+    amount = db.Column(Money, nullable=False)
 
+    # Period first, so "all fees for a term" can use the same index as the
+    # single (class, period) lookups.
     __table_args__ = (
-        db.UniqueConstraint('student_class', 'term', 'academic_year', name='_class_term_year_uc'),
+        db.UniqueConstraint('period_id', 'class_id', name='_period_class_uc'),
+        db.Index('ix_fees_class_id', 'class_id'),
     )
 
+    school_class = db.relationship('Class', lazy='joined', innerjoin=True)
+    period = db.relationship('Period', lazy='joined', innerjoin=True)
+
+    @property
+    def term(self):
+        """Term the fee applies to"""
+        return self.period.term
+
+    @property
+    def academic_year(self):
+        """Academic year the fee applies to"""
+        return self.period.academic_year
+
+    @property
+    def student_class(self):
+        """Name of the class the fee applies to"""
+        return self.school_class.name if self.school_class else None
+
     def __repr__(self):
         return f"<Fee {self.student_class} - {self.term} - {self.academic_year}>"
 
+# Materialized balances, maintained incrementally by app/ledger.py
+class StudentTermBalance(db.Model):
+    """
+    Running fee balance for one student in one period.
+    Rows are kept in step with payments, fees and class changes inside the
+    same transaction, so reading a balance is a single primary-key lookup.
+    """
+    __tablename__ = 'student_term_balances'
+
+    student_reg_number = db.Column(db.String(20), db.ForeignKey('students.reg_number'), primary_key=True)
+    period_id = db.Column(db.Integer, db.ForeignKey('periods.id'), primary_key=True)
+    expected_amount = db.Column(Money, nullable=False, default=0)
+    amount_paid = db.Column(Money, nullable=False, default=0)
+
+    @property
+    def outstanding_amount(self):
+        return self.expected_amount - self.amount_paid
+
+    def __repr__(self):
+        return f"<StudentTermBalance {self.student_reg_number} - period {self.period_id}>"
+
+class Period(db.Model):
+    """
+    One term of one academic year, e.g. First Term 2025/2026. `sequence`
+    numbers terms in calendar order, so sorting periods, taking a range of
+    them or finding the term before is an integer comparison. New periods
+    are added on demand by app/periods.py.
+    """
+    __tablename__ = 'periods'
+
+    id = db.Column(db.Integer, primary_key=True)
+    academic_year = db.Column(db.String(10), nullable=False)
+    term = db.Column(db.String(50), nullable=False)
+    sequence = db.Column(db.Integer, unique=True, nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('academic_year', 'term', name='_period_year_term_uc'),
+    )
+
+    def __repr__(self):
+        return f"<Period {self.term} {self.academic_year}>"
+
+class RegNumberSequence(db.Model):
+    """
+    Last registration number handed out for a school prefix and two-digit
+    year, e.g. ('AAM', '25') -> 17 after AAM/25/0017. See app/reg_numbers.py.
+    """
+    __tablename__ = 'reg_number_sequences'
+
+    prefix = db.Column(db.String(10), primary_key=True)
+    year = db.Column(db.String(2), primary_key=True)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<RegNumberSequence {self.prefix}/{self.year} at {self.last_value}>"
+
 # New Class Model to support dynamic class management
 class Class(db.Model):
     """
     Represents a class in the school (e.g., JSS 1, SS 3).
-    This allows admins to add classes dynamically.
+    This allows admins to add classes dynamically. Students, fees and
+    teachers refer to it by id, so renaming a class is a one-row update.
     """
     __tablename__ = 'classes'
     
@@ -126,3 +264,40 @@ class Class(db.Model):
 
     def __repr__(self):
         return f'<Class {self.name}>'
+
+class ReportJob(db.Model):
+    """
+    A PDF report rendered in the background by app/jobs.py.
+    The queue lives in this table so pending work survives a worker restart.
+    """
+    __tablename__ = 'report_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    report_type = db.Column(db.String(20), nullable=False)
+    student_class = db.Column(db.String(50), nullable=False)
+    term = db.Column(db.String(50), nullable=False)
+    academic_year = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    result_path = db.Column(db.String(255))
+    error = db.Column(db.Text)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # Set when the job is queued and refreshed while it runs; see recover_jobs in app/jobs.py.
+    heartbeat_at = db.Column(db.DateTime)
+
+    requester = db.relationship('User')
+
+    @property
+    def percent(self):
+        if self.status == 'done':
+            return 100
+        if not self.total:
+            return 0
+        return min(int(self.progress * 100 / self.total), 99)
+
+    def __repr__(self):
+        return f'<ReportJob {self.id} {self.status}>'
@@ -0,0 +1,69 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from sqlalchemy.types import BigInteger, TypeDecorator
+
+# Kobo per naira.
+KOBO_PER_NAIRA = 100
+KOBO = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+def to_naira(value):
+    """
+    Converts a number or numeric string (commas allowed) to a naira
+    `Decimal` rounded to the nearest kobo. Raises ValueError if the value is
+    not a finite number.
+    """
+    try:
+        # str() of a float is its shortest repr, so 0.1 stays 0.1 rather
+        # than its binary expansion.
+        amount = value if isinstance(value, Decimal) else Decimal(str(value).strip().replace(',', ''))
+        if amount.is_finite():
+            return amount.quantize(KOBO, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        pass
+    raise ValueError(f'{value!r} is not an amount of money')
+
+
+def to_kobo(value):
+    """
+    The whole number of kobo in a naira amount.
+    """
+    return int(to_naira(value) * KOBO_PER_NAIRA)
+
+
+def from_kobo(kobo):
+    """
+    The naira `Decimal` for a whole number of kobo.
+    """
+    return Decimal(int(kobo)).scaleb(-2)
+
+
+def format_currency(value):
+    """
+    Formats an amount as Naira with thousands separators, e.g. ₦25,000.00.
+    """
+    try:
+        return f"₦{to_naira(value):,.2f}"
+    except (ValueError, TypeError):
+        return "₦0.00"
+
+
+class Money(TypeDecorator):
+    """
+    A money column stored as an integer number of kobo and read back as a
+    naira `Decimal`. Sums and comparisons run on integers in the database,
+    so they are exact and never drift.
+    """
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return to_kobo(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return from_kobo(value)
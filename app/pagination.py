@@ -0,0 +1,124 @@
+import base64
+import binascii
+import json
+from datetime import date
+
+from sqlalchemy import Date, tuple_
+
+
+def _encode_date(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} cannot be used in a cursor')
+
+
+def encode_cursor(values):
+    """
+    Packs the sort key of a row into an opaque, URL-safe cursor string.
+    """
+    raw = json.dumps(list(values), separators=(',', ':'), default=_encode_date).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Unpacks a cursor made by `encode_cursor`. Returns None for anything
+    malformed so a tampered URL just starts from the first page.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, binascii.Error, UnicodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _cursor_values(columns, values):
+    """
+    Converts decoded cursor values back to their columns' types (dates
+    travel as ISO strings). Returns None if they don't fit the columns, so
+    a cursor holding lists, objects or values of the wrong type is treated
+    like any other malformed one instead of reaching the database.
+    """
+    if values is None or len(values) != len(columns):
+        return None
+    converted = []
+    for column, value in zip(columns, values):
+        if isinstance(column.type, Date):
+            if not isinstance(value, str):
+                return None
+            try:
+                value = date.fromisoformat(value)
+            except ValueError:
+                return None
+        # bool is an int subclass, but never a valid key.
+        elif isinstance(value, bool) or not isinstance(value, column.type.python_type):
+            return None
+        converted.append(value)
+    return converted
+
+
+class KeysetPage:
+    """
+    One page of results plus the cursors for the pages either side of it.
+    """
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, columns, key, page_size, after=None, before=None):
+    """
+    Returns a `KeysetPage` of `query` ordered by `columns` (ascending).
+
+    `key(row)` must return the values of `columns` for a row. Instead of
+    OFFSET, each page starts with a `(columns) > (cursor)` seek, which the
+    database answers from an index on the same columns, so page 100 costs
+    the same as page 1. Pass the previous page's `next_cursor` as `after`
+    or its `prev_cursor` as `before`.
+    """
+    after_values = _cursor_values(columns, decode_cursor(after))
+    before_values = _cursor_values(columns, decode_cursor(before)) if after_values is None else None
+    row_key = tuple_(*columns)
+
+    if before_values is not None and len(before_values) == len(columns):
+        # Walk backwards from the cursor, then flip the page back into order.
+        rows = (
+            query.filter(row_key < tuple_(*before_values))
+            .order_by(*[column.desc() for column in columns])
+            .limit(page_size + 1)
+            .all()
+        )
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(key(rows[-1])) if rows else None,
+            prev_cursor=encode_cursor(key(rows[0])) if rows and has_more else None
+        )
+
+    if after_values is not None and len(after_values) == len(columns):
+        query = query.filter(row_key > tuple_(*after_values))
+    else:
+        after_values = None
+
+    rows = query.order_by(*columns).limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(key(rows[-1])) if rows and has_more else None,
+        prev_cursor=encode_cursor(key(rows[0])) if rows and after_values is not None else None
+    )
@@ -0,0 +1,165 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from . import bcrypt
+
+# Bounds for the calibrated bcrypt cost of new hashes.
+MIN_BCRYPT_ROUNDS = 10
+MAX_BCRYPT_ROUNDS = 16
+# Cost timed at startup; every extra round doubles the work, so the result scales.
+PROBE_ROUNDS = 7
+PROBE_RUNS = 3
+
+
+class PasswordServiceBusy(Exception):
+    """
+    Raised when every hashing thread is busy and the queue is full, so the
+    request gives up instead of waiting behind a login storm.
+    """
+
+
+class BcryptHasher:
+    """
+    bcrypt through Flask-Bcrypt, at a fixed cost. The scheme for new hashes.
+    """
+    prefixes = ('$2a$', '$2b$', '$2y$')
+
+    def __init__(self, rounds):
+        self.rounds = rounds
+
+    def identifies(self, stored):
+        return stored.startswith(self.prefixes)
+
+    def hash(self, password):
+        return bcrypt.generate_password_hash(password, self.rounds).decode('utf-8')
+
+    def verify(self, password, stored):
+        return bcrypt.check_password_hash(stored, password)
+
+    def needs_rehash(self, stored):
+        # '$2b$12$...': the cost is the second field.
+        return int(stored.split('$')[2]) < self.rounds
+
+
+class WerkzeugHasher:
+    """
+    werkzeug's 'method$salt$hash' strings (pbkdf2 or scrypt), as written by
+    fix_password.py and older versions of the first-admin route.
+    """
+    prefixes = ('pbkdf2:', 'scrypt:')
+
+    def identifies(self, stored):
+        return stored.startswith(self.prefixes)
+
+    def hash(self, password):
+        return generate_password_hash(password)
+
+    def verify(self, password, stored):
+        return check_password_hash(stored, password)
+
+    def needs_rehash(self, stored):
+        return False
+
+
+class PasswordService:
+    """
+    Hashes and checks passwords on a bounded thread pool. The first hasher
+    makes new hashes; the others only have to recognize and verify what is
+    already stored. Both bcrypt and pbkdf2 release the GIL, so hashing
+    threads do not hold up the worker's other requests.
+
+    At most `workers` hashes run at once and `queue_size` more wait. Callers
+    beyond that wait up to `wait` seconds for a slot and then get
+    PasswordServiceBusy.
+    """
+    def __init__(self, hashers, workers, queue_size, wait):
+        self.hashers = hashers
+        self.wait = wait
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(timeout=self.wait):
+            raise PasswordServiceBusy('Too many password checks are waiting.')
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hasher_for(self, stored):
+        """
+        The hasher that wrote `stored`, or None for an unknown format.
+        """
+        for hasher in self.hashers:
+            if stored and hasher.identifies(stored):
+                return hasher
+        return None
+
+    def hash(self, password):
+        return self._run(self.hashers[0].hash, password)
+
+    def verify(self, password, stored):
+        """
+        Checks `password` against a stored hash in any known format. Returns
+        `(matches, new_hash)`; `new_hash` is set when the password matched a
+        hash from an older scheme or a lower cost, and should replace it.
+        """
+        hasher = self.hasher_for(stored)
+        if hasher is None or not self._run(hasher.verify, password, stored):
+            return False, None
+        if hasher is not self.hashers[0] or hasher.needs_rehash(stored):
+            return True, self.hash(password)
+        return True, None
+
+
+def calibrate_bcrypt_rounds(target_seconds):
+    """
+    The highest bcrypt cost, within MIN_BCRYPT_ROUNDS and MAX_BCRYPT_ROUNDS,
+    whose hash takes no longer than `target_seconds` on this machine. Times
+    a few cheap hashes and scales the fastest one.
+    """
+    fastest = None
+    for _ in range(PROBE_RUNS):
+        start = time.perf_counter()
+        bcrypt.generate_password_hash('calibration', PROBE_ROUNDS)
+        elapsed = time.perf_counter() - start
+        fastest = elapsed if fastest is None else min(fastest, elapsed)
+
+    rounds = PROBE_ROUNDS + math.floor(math.log2(target_seconds / max(fastest, 1e-6)))
+    return max(MIN_BCRYPT_ROUNDS, min(rounds, MAX_BCRYPT_ROUNDS))
+
+
+def hash_password(password):
+    """
+    A new hash of `password` in the preferred scheme.
+    """
+    return current_app.extensions['passwords'].hash(password)
+
+
+def verify_password(password, stored):
+    """
+    See `PasswordService.verify`.
+    """
+    return current_app.extensions['passwords'].verify(password, stored)
+
+
+def init_app(app):
+    """
+    Creates the app's password service. The bcrypt cost is calibrated here
+    to PASSWORD_HASH_TARGET_MS unless PASSWORD_HASH_ROUNDS fixes it.
+    """
+    rounds = app.config['PASSWORD_HASH_ROUNDS'] or calibrate_bcrypt_rounds(app.config['PASSWORD_HASH_TARGET_MS'] / 1000)
+    app.extensions['passwords'] = PasswordService(
+        [BcryptHasher(rounds), WerkzeugHasher()],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_size=app.config['PASSWORD_HASH_QUEUE'],
+        wait=app.config['PASSWORD_HASH_WAIT']
+    )
@@ -0,0 +1,90 @@
+import calendar
+import re
+from datetime import date
+
+from sqlalchemy import select
+
+from . import db
+from .database import on_commit, upsert
+from .models import Period
+
+TERMS = ('First Term', 'Second Term', 'Third Term')
+
+ACADEMIC_YEAR = re.compile(r'^(\d{4})/(\d{4})$')
+
+# Default term dates: (years after the academic year's first year, first month, last month).
+# A period's stored dates can be changed afterwards; these only seed new rows.
+TERM_CALENDAR = {
+    'First Term': (0, 9, 12),
+    'Second Term': (1, 1, 4),
+    'Third Term': (1, 5, 8),
+}
+
+periods = Period.__table__
+
+
+def period_values(academic_year, term):
+    """
+    Column values for a new period with the default calendar dates. The
+    sequence counts terms from year zero, so consecutive terms differ by one
+    across academic years too. Raises ValueError for an unknown term or an
+    academic year that does not look like 2025/2026.
+    """
+    match = ACADEMIC_YEAR.match(academic_year or '')
+    if not match or int(match.group(2)) != int(match.group(1)) + 1:
+        raise ValueError(f"academic year '{academic_year}' must look like 2025/2026")
+    if term not in TERMS:
+        raise ValueError(f"term must be one of {', '.join(TERMS)}")
+
+    first_year = int(match.group(1))
+    offset, first_month, last_month = TERM_CALENDAR[term]
+    year = first_year + offset
+    return {
+        'academic_year': academic_year,
+        'term': term,
+        'sequence': first_year * len(TERMS) + TERMS.index(term),
+        'start_date': date(year, first_month, 1),
+        'end_date': date(year, last_month, calendar.monthrange(year, last_month)[1]),
+    }
+
+
+def term_for_date(day):
+    """
+    The (academic_year, term) the default calendar puts `day` in.
+    """
+    for term, (offset, first_month, last_month) in TERM_CALENDAR.items():
+        if first_month <= day.month <= last_month:
+            first_year = day.year - offset
+            return f'{first_year}/{first_year + 1}', term
+    raise ValueError(f'{day} is not in any term')
+
+
+def create_period(connection, academic_year, term):
+    """
+    Inserts the period for `academic_year` and `term` on `connection` unless
+    it already exists, and returns its id. Safe to race: the loser's insert
+    is a no-op.
+    """
+    key = (periods.c.academic_year == academic_year) & (periods.c.term == term)
+    period_id = connection.execute(select(periods.c.id).where(key)).scalar()
+    if period_id is not None:
+        return period_id
+
+    upsert(connection, periods, period_values(academic_year, term))
+    return connection.execute(select(periods.c.id).where(key)).scalar()
+
+
+def ensure_period(academic_year, term):
+    """
+    The id of the period for `academic_year` and `term`, created in the
+    current transaction if this is the first fee or payment recorded for it.
+    Raises ValueError like `period_values`.
+    """
+    from . import reference_data
+
+    period_id = reference_data.period_id(academic_year, term)
+    if period_id is None:
+        period_id = create_period(db.session.connection(), academic_year, term)
+        # A Core insert skips the flush listeners, so flag the change by hand.
+        on_commit(db.session, reference_data.invalidate_reference_data)
+    return period_id
@@ -0,0 +1,112 @@
+import sys
+from datetime import date
+
+import click
+
+from . import db
+from .models import User, Student, Payment, Fee, Period
+from .fee_status import fee_status_query, fee_breakdown_query
+
+# Sample values only shape the plans; they don't need to exist in the database.
+SAMPLE_CLASS_ID = 1
+SAMPLE_PERIOD_ID = 1
+SAMPLE_TERM = 'First Term'
+SAMPLE_SEQUENCE = 6072
+SAMPLE_REG_NUMBER = 'AAM/25/0001'
+SAMPLE_DATE = date(2025, 1, 6)
+
+
+def hot_queries():
+    """
+    The filtered queries behind the dashboard, student list, student details,
+    reports and the balance ledger, keyed by a short name.
+    """
+    return {
+        'students_by_class': fee_status_query(
+            Student.query.filter_by(class_id=SAMPLE_CLASS_ID), SAMPLE_PERIOD_ID
+        ),
+        'students_by_term': Student.query.filter_by(term=SAMPLE_TERM),
+        'recent_students': Student.query.order_by(Student.admission_date.desc()).limit(5),
+        'officer_count': db.session.query(db.func.count(User.id)).filter(User.role == 'officer'),
+        'student_payments': Payment.query.filter_by(student_reg_number=SAMPLE_REG_NUMBER),
+        'student_fee_breakdown': fee_breakdown_query(
+            Student(reg_number=SAMPLE_REG_NUMBER, class_id=SAMPLE_CLASS_ID), [SAMPLE_PERIOD_ID]
+        ),
+        'student_period_total': db.session.query(db.func.sum(Payment.amount_paid)).filter(
+            Payment.student_reg_number == SAMPLE_REG_NUMBER,
+            Payment.period_id == SAMPLE_PERIOD_ID
+        ),
+        'period_payments': Payment.query.filter_by(period_id=SAMPLE_PERIOD_ID),
+        'payments_by_date': Payment.query.filter(
+            Payment.payment_date.between(SAMPLE_DATE, SAMPLE_DATE), Payment.recorded_by == 1
+        ),
+        'period_fees': Fee.query.filter_by(period_id=SAMPLE_PERIOD_ID),
+        'class_fee': Fee.query.filter_by(class_id=SAMPLE_CLASS_ID, period_id=SAMPLE_PERIOD_ID),
+        'periods_from': Period.query.filter(Period.sequence >= SAMPLE_SEQUENCE).order_by(Period.sequence),
+    }
+
+
+def explain(query):
+    """
+    Returns the database's query plan for a query as a list of strings.
+    """
+    dialect = db.session.get_bind().dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+    if dialect.name == 'sqlite':
+        rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).fetchall()
+        return [row[-1] for row in rows]
+
+    # Small tables make the planner prefer sequential scans regardless of
+    # indexes, so ask it whether an index *can* be used.
+    db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+    rows = db.session.execute(db.text(f'EXPLAIN {sql}')).fetchall()
+    return [row[0] for row in rows]
+
+
+def full_scans(plan):
+    """
+    The plan lines that read a whole table without an index.
+    """
+    scans = []
+    for line in plan:
+        detail = line.strip()
+        if detail.startswith('SCAN ') and 'USING' not in detail:
+            scans.append(detail)
+        elif 'Seq Scan' in detail:
+            scans.append(detail)
+    return scans
+
+
+def check_query_plans():
+    """
+    Explains every hot query and returns `{name: [full-scan plan lines]}` for
+    the ones that don't use an index. An empty dict means all is well.
+    """
+    problems = {}
+    try:
+        for name, query in hot_queries().items():
+            scans = full_scans(explain(query))
+            if scans:
+                problems[name] = scans
+    finally:
+        db.session.rollback()
+    return problems
+
+
+def init_app(app):
+    """
+    Registers the `check-indexes` CLI command, which runs the same check as
+    tests/test_query_plans.py against a real database.
+    """
+    @app.cli.command('check-indexes')
+    def check_indexes_command():
+        """Fail if any hot query falls back to a full table scan."""
+        problems = check_query_plans()
+        for name, scans in problems.items():
+            click.echo(f'{name}: full table scan')
+            for scan in scans:
+                click.echo(f'    {scan}')
+        if problems:
+            sys.exit(1)
+        click.echo('All hot queries use an index.')
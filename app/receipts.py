@@ -0,0 +1,362 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+
+from flask import current_app
+from sqlalchemy import event, inspect, select
+
+from . import db
+from .database import on_commit
+from .models import User, Student, Payment, StudentTermBalance, Class, Period
+from . import reference_data
+from .money import ZERO
+from .generate_payments import create_payment_receipt, create_payment_receipts, LOGO_PATH
+
+# Bump whenever the receipt layout changes so cached PDFs are re-rendered.
+TEMPLATE_VERSION = 2
+
+SCHOOL_DETAILS = {
+    'name': "ALFURQAN ACADEMY",
+    'motto': "Galadima Road, Mai'adua",
+    'logo_path': LOGO_PATH,
+}
+
+# Payments fetched per round trip when rendering receipts in bulk.
+BULK_FETCH_SIZE = 200
+
+# Seconds between refreshes of a cached receipt's modification time on hits.
+TOUCH_INTERVAL = 3600
+
+
+def _receipt_select():
+    return (
+        select(
+            Payment.id,
+            Payment.amount_paid,
+            Payment.payment_date,
+            Period.term,
+            Period.academic_year,
+            Student.name,
+            Student.reg_number,
+            Class.name.label('student_class'),
+            User.username,
+            StudentTermBalance.expected_amount,
+            StudentTermBalance.amount_paid.label('period_paid')
+        )
+        .join(Student, Student.reg_number == Payment.student_reg_number)
+        .join(Class, Class.id == Student.class_id)
+        .join(Period, Period.id == Payment.period_id)
+        .join(User, User.id == Payment.recorded_by)
+        .outerjoin(StudentTermBalance, (
+            (StudentTermBalance.student_reg_number == Payment.student_reg_number)
+            & (StudentTermBalance.period_id == Payment.period_id)
+        ))
+    )
+
+
+def _row_fields(row):
+    return {
+        'payment_id': row.id,
+        'amount_paid': row.amount_paid,
+        'payment_date': row.payment_date,
+        'term': row.term,
+        'academic_year': row.academic_year,
+        'student_name': row.name,
+        'reg_number': row.reg_number,
+        'student_class': row.student_class,
+        'recorded_by': row.username,
+        # Outstanding for the payment's term, as of when the receipt is printed.
+        'balance': max((row.expected_amount or ZERO) - (row.period_paid or ZERO), ZERO),
+    }
+
+
+def receipt_fields(payment_id):
+    """
+    Loads everything printed on a receipt with one joined query.
+    Returns a dict, or None if the payment does not exist.
+    """
+    row = db.session.execute(_receipt_select().where(Payment.id == payment_id)).first()
+    return None if row is None else _row_fields(row)
+
+
+def receipt_rows(student_class=None, term=None, academic_year=None, date_from=None, date_to=None):
+    """
+    Yields the receipt fields of every payment matching the filters, oldest
+    first. Uses one joined query whose rows are streamed in batches.
+    `date_from` and `date_to` are inclusive `date`s.
+    """
+    stmt = _receipt_select()
+    if student_class:
+        stmt = stmt.where(Student.class_id == reference_data.class_id(student_class))
+    if term:
+        stmt = stmt.where(Period.term == term)
+    if academic_year:
+        stmt = stmt.where(Period.academic_year == academic_year)
+    if date_from:
+        stmt = stmt.where(Payment.payment_date >= date_from)
+    if date_to:
+        stmt = stmt.where(Payment.payment_date <= date_to)
+    stmt = stmt.order_by(Payment.payment_date, Payment.id).execution_options(yield_per=BULK_FETCH_SIZE)
+
+    for row in db.session.execute(stmt):
+        yield _row_fields(row)
+
+
+def receipt_details(fields):
+    """
+    Maps receipt fields onto the keys `create_payment_receipt` prints.
+    """
+    return {
+        'receipt_no': f"{fields['payment_id']:06d}",
+        'date': fields['payment_date'],
+        'student_name': fields['student_name'],
+        'admission_no': fields['reg_number'],
+        'class': fields['student_class'],
+        'term': fields['term'],
+        'academic_year': fields['academic_year'],
+        'amount_paid': fields['amount_paid'],
+        'balance': fields['balance'],
+        'received_by': fields['recorded_by'],
+    }
+
+
+def build_receipt_pdf(fields):
+    """
+    Draws a single payment receipt and returns the PDF bytes.
+    """
+    buffer = io.BytesIO()
+    create_payment_receipt(receipt_details(fields), SCHOOL_DETAILS, buffer)
+    return buffer.getvalue()
+
+
+def write_receipts_pdf(output, rows):
+    """
+    Draws one receipt per page for every fields dict in `rows` into a single
+    PDF written to `output`. Returns the number of receipts; nothing is
+    written when there are none.
+    """
+    return create_payment_receipts((receipt_details(fields) for fields in rows), SCHOOL_DETAILS, output)
+
+
+class _StreamSink:
+    """
+    Write-only file object for `zipfile`. It has no `seek`, so zipfile
+    writes sizes in data descriptors instead of rewinding, and whatever has
+    been written so far can be drained and sent to the client.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_receipts_zip(rows):
+    """
+    Yields a ZIP archive with one PDF receipt per fields dict in `rows`,
+    chunk by chunk, so only the receipt being rendered is held in memory.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for fields in rows:
+            archive.writestr(receipt_filename(fields), build_receipt_pdf(fields))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def receipt_filename(fields):
+    return f"receipt_{fields['student_name'].replace(' ', '_')}_{fields['payment_id']}.pdf"
+
+
+class ReceiptCache:
+    """
+    Size-bounded on-disk cache of rendered receipts.
+
+    Files are stored as `<payment_id>/<digest>.pdf`, where the digest covers
+    every printed field and TEMPLATE_VERSION, so any change to what a receipt
+    shows produces a new entry. A payment's older versions are found by
+    listing its own directory. File modification times track recency; hits
+    refresh them at most once per TOUCH_INTERVAL.
+
+    Each process keeps a running total of the cache size, taken from one scan
+    and updated as it writes. The directory is only scanned again, and the
+    least recently used files evicted, once that total passes `max_bytes`.
+    Other workers' writes are picked up by that scan.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._total = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def digest(fields):
+        payload = json.dumps([TEMPLATE_VERSION, fields], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def _payment_dir(self, payment_id):
+        return os.path.join(self.directory, str(payment_id))
+
+    def path_for(self, fields):
+        return os.path.join(self._payment_dir(fields['payment_id']), f"{self.digest(fields)}.pdf")
+
+    def open(self, fields):
+        """
+        Returns an open binary file for a cached receipt, or None on a miss.
+        The open handle stays valid even if another worker evicts the file.
+        """
+        path = self.path_for(fields)
+        try:
+            handle = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            if time.time() - os.fstat(handle.fileno()).st_mtime > TOUCH_INTERVAL:
+                os.utime(path)
+        except OSError:
+            pass
+        return handle
+
+    def put(self, fields, data):
+        """
+        Stores rendered receipt bytes, replacing older versions of the same payment.
+        """
+        path = self.path_for(fields)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial_path = f"{path}.{os.getpid()}.part"
+        with open(partial_path, 'wb') as output:
+            output.write(data)
+        os.replace(partial_path, path)
+
+        removed = self._remove_versions(fields['payment_id'], keep=path)
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._scan())
+            else:
+                self._total += len(data) - removed
+            over_budget = self._total > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _remove_versions(self, payment_id, keep=None):
+        """
+        Deletes the cached receipts of one payment, except `keep`. Returns the bytes freed.
+        """
+        freed = 0
+        try:
+            entries = list(os.scandir(self._payment_dir(payment_id)))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            if entry.name.endswith('.pdf') and entry.path != keep:
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                freed += size
+        return freed
+
+    def invalidate(self, payment_ids):
+        """
+        Deletes every cached receipt for the given payments.
+        """
+        freed = sum(self._remove_versions(payment_id) for payment_id in payment_ids)
+        with self._lock:
+            if self._total is not None:
+                self._total -= freed
+
+    def _scan(self):
+        """
+        `(mtime, size, path)` of every cached receipt. Also picks up files in
+        the flat `<payment_id>-<digest>.pdf` layout of earlier versions, so
+        eviction clears them out.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            children = list(os.scandir(entry.path)) if entry.is_dir() else [entry]
+            for child in children:
+                if not child.name.endswith('.pdf'):
+                    continue
+                try:
+                    stat = child.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, child.path))
+        return entries
+
+    def evict(self):
+        """
+        Removes least recently used receipts until the cache fits in max_bytes.
+        """
+        with self._lock:
+            entries = self._scan()
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                for _, size, path in sorted(entries):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+            self._total = total
+
+
+def get_receipt_cache():
+    """
+    The receipt cache for the current app, created on first use.
+    """
+    app = current_app._get_current_object()
+    cache = app.extensions.get('receipt_cache')
+    if cache is None:
+        cache = ReceiptCache(app.config['RECEIPT_CACHE_DIR'], app.config['RECEIPT_CACHE_MAX_BYTES'])
+        app.extensions['receipt_cache'] = cache
+    return cache
+
+
+def _after_flush(session, flush_context):
+    """
+    Notes the payments whose receipts change when a student's name or class does.
+    """
+    reg_numbers = [
+        obj.reg_number for obj in session.dirty
+        if isinstance(obj, Student) and (
+            inspect(obj).attrs.name.history.has_changes()
+            or inspect(obj).attrs.class_id.history.has_changes()
+        )
+    ]
+    if not reg_numbers:
+        return
+    payment_ids = session.connection().execute(
+        select(Payment.id).where(Payment.student_reg_number.in_(reg_numbers))
+    ).scalars().all()
+    on_commit(session, _invalidate_receipts, *payment_ids)
+
+
+def _invalidate_receipts(*payment_ids):
+    get_receipt_cache().invalidate(payment_ids)
+
+
+if not event.contains(db.session, 'after_flush', _after_flush):
+    event.listen(db.session, 'after_flush', _after_flush)
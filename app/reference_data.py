@@ -0,0 +1,185 @@
+import threading
+import time
+import uuid
+from datetime import date
+
+from flask import current_app
+from sqlalchemy import event, select
+
+from . import db
+from .cache import get_cache
+from .database import on_commit
+from .models import Class, Period
+from .periods import create_period, term_for_date
+
+# Shared cache key holding the current version of the reference data. Any
+# change to classes or periods replaces it, which tells every worker to reload.
+VERSION_KEY = 'reference_data:version'
+
+# A lookup that finds nothing reloads a snapshot at most this many seconds old.
+MISS_RELOAD_INTERVAL = 5
+
+_load_lock = threading.Lock()
+
+
+class ReferenceData:
+    """
+    A read-only snapshot of the class list and the periods. `periods` maps
+    ids to period rows in sequence order. Expected fees are not kept here:
+    they are joined from `fees` in SQL (see app/fee_status.py and
+    app/ledger.py).
+    """
+    def __init__(self, version, class_ids, periods):
+        self.version = version
+        self.class_ids = class_ids
+        self.class_names = sorted(class_ids)
+        self.periods = periods
+        self.period_ids = {(period.academic_year, period.term): period.id for period in periods.values()}
+        self.loaded_at = time.monotonic()
+
+    def is_fresh(self):
+        return time.monotonic() - self.loaded_at < MISS_RELOAD_INTERVAL
+
+
+def _load(version):
+    """
+    Reads classes and periods on a connection of its own, so that uncommitted
+    changes in the current session never end up in the shared snapshot.
+    """
+    with db.engine.connect() as connection:
+        class_ids = dict(connection.execute(select(Class.name, Class.id)).all())
+        periods = {
+            period.id: period
+            for period in connection.execute(
+                select(Period.id, Period.academic_year, Period.term, Period.sequence,
+                       Period.start_date, Period.end_date).order_by(Period.sequence)
+            )
+        }
+    return ReferenceData(version, class_ids, periods)
+
+
+def _current_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(VERSION_KEY, version, current_app.config['REFERENCE_DATA_TTL'])
+    return version
+
+
+def get_reference_data():
+    """
+    The current `ReferenceData` for this worker. It is loaded once and kept
+    until the shared version changes, so in the steady state a lookup costs
+    one cache read and no queries.
+    """
+    app = current_app._get_current_object()
+    version = _current_version()
+    snapshot = app.extensions.get('reference_data')
+    if snapshot is None or snapshot.version != version:
+        with _load_lock:
+            snapshot = app.extensions.get('reference_data')
+            if snapshot is None or snapshot.version != version:
+                snapshot = _load(version)
+                app.extensions['reference_data'] = snapshot
+    return snapshot
+
+
+def _lookup(find):
+    """
+    `find(snapshot)` on the current snapshot, retried on a fresh load from
+    the database when it finds nothing. With the per-process memory cache, a
+    class or period created in another worker only reaches this one when the
+    version entry expires, and until then it would look missing.
+
+    Misses are routine (unknown filters, terms with no period yet), so a
+    snapshot loaded in the last MISS_RELOAD_INTERVAL seconds is trusted
+    rather than reloaded again.
+    """
+    snapshot = get_reference_data()
+    value = find(snapshot)
+    if value is None and not snapshot.is_fresh():
+        app = current_app._get_current_object()
+        with _load_lock:
+            snapshot = app.extensions.get('reference_data')
+            if snapshot is None or not snapshot.is_fresh():
+                snapshot = _load(_current_version())
+                app.extensions['reference_data'] = snapshot
+        value = find(snapshot)
+    return value
+
+
+def class_names():
+    """
+    Sorted names of every class, for dropdowns and validation.
+    """
+    return get_reference_data().class_names
+
+
+def class_id(name):
+    """
+    The id of the class called `name`, or None if there is no such class.
+    """
+    return _lookup(lambda snapshot: snapshot.class_ids.get(name))
+
+
+def period_id(academic_year, term):
+    """
+    The id of the period for `academic_year` and `term`, or None if nothing
+    has been recorded for it yet.
+    """
+    return _lookup(lambda snapshot: snapshot.period_ids.get((academic_year, term)))
+
+
+def current_period(today=None):
+    """
+    The period whose dates include `today` (default: the current date). If
+    none does, the term the default calendar gives, which is created on the
+    first request that needs it.
+    """
+    today = today or date.today()
+    snapshot = get_reference_data()
+    for period in snapshot.periods.values():
+        if period.start_date <= today <= period.end_date:
+            return period
+
+    key = term_for_date(today)
+    if key not in snapshot.period_ids:
+        # Committed on its own connection so the shared snapshot can include it.
+        with db.engine.begin() as connection:
+            create_period(connection, *key)
+        invalidate_reference_data()
+        snapshot = get_reference_data()
+    return snapshot.periods[snapshot.period_ids[key]]
+
+
+def invalidate_reference_data():
+    """
+    Starts a new version of the reference data. This worker drops its
+    snapshot at once; other workers reload on their next lookup, or, with the
+    per-process memory cache, once their version entry expires or a lookup
+    misses.
+    """
+    app = current_app._get_current_object()
+    app.extensions.pop('reference_data', None)
+    get_cache().set(VERSION_KEY, uuid.uuid4().hex, app.config['REFERENCE_DATA_TTL'])
+
+
+def _after_flush(session, flush_context):
+    """
+    Notes whether the flush touched classes or periods.
+    """
+    changed = (
+        any(isinstance(obj, (Class, Period)) for obj in session.new)
+        or any(isinstance(obj, (Class, Period)) for obj in session.deleted)
+        or any(
+            isinstance(obj, (Class, Period)) and session.is_modified(obj, include_collections=False)
+            for obj in session.dirty
+        )
+    )
+    if changed:
+        on_commit(session, invalidate_reference_data)
+
+
+if not event.contains(db.session, 'after_flush', _after_flush):
+    event.listen(db.session, 'after_flush', _after_flush)
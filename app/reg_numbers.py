@@ -0,0 +1,100 @@
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from . import db
+from .database import upsert
+from .models import Student, RegNumberSequence
+
+# A dummy variable to be replaced with the actual school short name from config.
+# This should be defined in a separate config file for best practice.
+SCHOOL_SHORT_NAME = 'AAM'
+
+sequences = RegNumberSequence.__table__
+
+
+def format_reg_number(prefix, year, number):
+    """
+    Format: PREFIX/YY/NNNN, e.g. AAM/25/0001.
+    """
+    return f'{prefix}/{year}/{number:04d}'
+
+
+def _highest_existing(prefix, year):
+    """
+    The largest number already used by a student for this prefix and year.
+    Only needed once, when a year's sequence row is created.
+    """
+    highest = 0
+    reg_numbers = db.session.execute(
+        select(Student.reg_number).where(Student.reg_number.like(f'{prefix}/{year}/%'))
+    ).scalars()
+    for reg_number in reg_numbers:
+        suffix = reg_number.rsplit('/', 1)[-1]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    return highest
+
+
+def _create_sequence(prefix, year):
+    """
+    Inserts the sequence row for a new year, starting after any numbers that
+    are already in use. Safe to race: the loser's insert is a no-op.
+    """
+    values = {'prefix': prefix, 'year': year, 'last_value': _highest_existing(prefix, year)}
+    upsert(db.session.connection(), sequences, values)
+
+
+def _advance(prefix, year, count):
+    """
+    Moves the sequence on by `count` and returns its new last value, or None
+    if the row does not exist yet. The row stays locked until the caller's
+    transaction ends, so concurrent allocations queue up instead of reading
+    the same value.
+    """
+    key = (sequences.c.prefix == prefix) & (sequences.c.year == year)
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(
+            update(sequences)
+            .where(key)
+            .values(last_value=sequences.c.last_value + count)
+            .returning(sequences.c.last_value)
+        ).scalar()
+
+    last_value = db.session.execute(
+        select(sequences.c.last_value).where(key).with_for_update()
+    ).scalar()
+    if last_value is None:
+        return None
+    db.session.execute(update(sequences).where(key).values(last_value=last_value + count))
+    return last_value + count
+
+
+def reserve_reg_numbers(count, prefix=SCHOOL_SHORT_NAME, year=None):
+    """
+    Atomically reserves `count` consecutive registration numbers for
+    `prefix` and `year` (two digits, default: the current year) and returns
+    them in order. This is one UPDATE however many numbers are taken, so bulk
+    enrollment can reserve a whole block up front.
+
+    The reservation belongs to the current transaction: committing keeps it,
+    rolling back hands the numbers out again.
+    """
+    if count < 1:
+        return []
+    year = year or datetime.now().strftime('%y')
+
+    last_value = _advance(prefix, year, count)
+    if last_value is None:
+        _create_sequence(prefix, year)
+        last_value = _advance(prefix, year, count)
+
+    first = last_value - count + 1
+    return [format_reg_number(prefix, year, number) for number in range(first, last_value + 1)]
+
+
+def next_reg_number(prefix=SCHOOL_SHORT_NAME, year=None):
+    """
+    Reserves a single registration number. See `reserve_reg_numbers`.
+    """
+    return reserve_reg_numbers(1, prefix=prefix, year=year)[0]
@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, has_request_context, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import column, event, func, select, table, text
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+# Bind key of the read replica in SQLALCHEMY_BINDS.
+REPLICA_BIND = 'replica'
+
+# Flask session key: until this time.time(), the user's reads stay on the primary.
+PRIMARY_UNTIL = 'read_primary_until'
+
+# Seconds a Postgres standby is behind: zero once it has replayed everything
+# it received, NULL when the database is not a standby at all.
+POSTGRES_REPLAY_LAG = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+payments = table('payments', column('id'))
+
+
+def _is_plain_select(clause):
+    return (
+        clause is not None
+        and clause.is_select
+        and getattr(clause, '_for_update_arg', None) is None
+    )
+
+
+class RoutingSession(Session):
+    """
+    `db.session`, with reads sent to the replica once `use_replica` has been
+    called for it. Only plain SELECTs go there; flushes, INSERT/UPDATE/DELETE,
+    SELECT ... FOR UPDATE and bare `session.connection()` calls always use
+    the primary.
+
+    The first write pins the rest of the session to the primary, so a view
+    reads back what it just changed, unless it was routed with
+    `pin_on_write=False`.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['wrote'] = True
+                if self.info.get('pin_on_write', True):
+                    self.info.pop('read_from', None)
+            elif self.info.get('read_from') == REPLICA_BIND and _is_plain_select(clause):
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaMonitor:
+    """
+    Decides whether the replica is close enough to the primary to read from.
+    The lag is measured at most once every `check_interval` seconds per
+    process. A Postgres standby reports its replay delay. Any other replica
+    counts as current only while it has the primary's newest payment, so two
+    SQLite files are in sync until a payment is recorded on the primary.
+    """
+    def __init__(self, primary, replica, max_lag, check_interval):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def _measure(self):
+        """
+        The replica's lag in seconds, or None if it is behind by an unknown amount.
+        """
+        with self.replica.connect() as connection:
+            if connection.dialect.name == 'postgresql':
+                lag = connection.execute(POSTGRES_REPLAY_LAG).scalar()
+                if lag is not None:
+                    return float(lag)
+            replica_mark = connection.execute(select(func.max(payments.c.id))).scalar()
+        with self.primary.connect() as connection:
+            primary_mark = connection.execute(select(func.max(payments.c.id))).scalar()
+        return 0.0 if (replica_mark or 0) >= (primary_mark or 0) else None
+
+    def available(self):
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.check_interval:
+                try:
+                    self.lag = self._measure()
+                except SQLAlchemyError as e:
+                    logger.warning('Read replica unavailable, reading from the primary: %s', e)
+                    self.lag = None
+                self._checked_at = time.monotonic()
+            return self.lag is not None and self.lag <= self.max_lag
+
+
+def use_replica(pin_on_write=True):
+    """
+    Sends the rest of this session's reads to the replica, if one is
+    configured and within DATABASE_REPLICA_MAX_LAG of the primary. Returns
+    whether it did.
+    """
+    from . import db
+
+    monitor = current_app.extensions.get('replica_monitor')
+    if monitor is None or not monitor.available():
+        return False
+    db.session.info['read_from'] = REPLICA_BIND
+    db.session.info['pin_on_write'] = pin_on_write
+    return True
+
+
+def reads_from_replica(view):
+    """
+    Routes a read-only view's queries to the replica. The request stays on
+    the primary when it asks to with `?read_from=primary`, or when the user
+    changed something in the last DATABASE_REPLICA_STICKY_SECONDS.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.args.get('read_from') != 'primary' and flask_session.get(PRIMARY_UNTIL, 0) <= time.time():
+            use_replica()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _after_commit(session):
+    # The replica may not have this commit yet, so the user's next pages read from the primary.
+    wrote = session.info.pop('wrote', None)
+    if wrote and has_request_context() and 'replica_monitor' in current_app.extensions:
+        flask_session[PRIMARY_UNTIL] = time.time() + current_app.config['DATABASE_REPLICA_STICKY_SECONDS']
+
+
+def _after_rollback(session):
+    session.info.pop('wrote', None)
+
+
+for _name, _listener in (('after_commit', _after_commit), ('after_rollback', _after_rollback)):
+    if not event.contains(RoutingSession, _name, _listener):
+        event.listen(RoutingSession, _name, _listener)
+
+
+def init_app(app):
+    """
+    Starts watching the replica when a replica bind is configured. Call
+    after `db.init_app`.
+    """
+    from . import db
+
+    if REPLICA_BIND not in app.config['SQLALCHEMY_BINDS']:
+        return
+    with app.app_context():
+        app.extensions['replica_monitor'] = ReplicaMonitor(
+            db.engines[None],
+            db.engines[REPLICA_BIND],
+            max_lag=app.config['DATABASE_REPLICA_MAX_LAG'],
+            check_interval=app.config['DATABASE_REPLICA_CHECK_INTERVAL']
+        )
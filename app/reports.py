@@ -0,0 +1,206 @@
+from itertools import islice
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+from .models import Student
+from .fee_status import fee_status_rows, PAID, DEFAULTER
+from .pagination import keyset_paginate
+from . import reference_data
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 0.6 * inch
+ROW_HEIGHT = 16
+ROWS_PER_PAGE = 36
+NAME_MAX_CHARS = 38
+
+# report_type -> (fee status to include, title prefix)
+REPORT_TYPES = {
+    'paid': (PAID, 'Paid Students Report'),
+    'unpaid': (DEFAULTER, 'Unpaid Students Report'),
+}
+# Rows fetched from the database per round trip while rendering.
+FETCH_BATCH_SIZE = 500
+
+HEADER = ['#', 'Name', 'Reg. Number', 'Class', 'Expected', 'Paid', 'Outstanding']
+COL_WIDTHS = [0.4 * inch, 2.4 * inch, 1.15 * inch, 0.8 * inch, 0.9 * inch, 0.9 * inch, 0.95 * inch]
+
+# Built once and shared by every page of every report.
+PAGE_TABLE_STYLE = TableStyle([
+    ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 9),
+    ('FONT', (0, 1), (-1, -1), 'Helvetica', 8),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f2937')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.HexColor('#f3f4f6')]),
+    ('FONT', (0, -1), (-1, -1), 'Helvetica-Bold', 8),
+    ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e5e7eb')),
+    ('LINEABOVE', (0, -1), (-1, -1), 0.75, colors.HexColor('#1f2937')),
+    ('ALIGN', (4, 0), (-1, -1), 'RIGHT'),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#d1d5db')),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+SUMMARY_TABLE_STYLE = TableStyle([
+    ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
+    ('FONT', (0, 0), (0, -1), 'Helvetica-Bold', 10),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('BOX', (0, 0), (-1, -1), 0.75, colors.HexColor('#1f2937')),
+    ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#d1d5db')),
+    ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
+])
+
+
+def _money(value):
+    return f"{value:,.2f}"
+
+
+def _shorten(text, limit):
+    text = text or ''
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def _draw_page_frame(c, title, subtitle, page_number):
+    c.setFont('Helvetica-Bold', 14)
+    c.drawString(MARGIN, PAGE_HEIGHT - MARGIN, title)
+    c.setFont('Helvetica', 9)
+    c.drawString(MARGIN, PAGE_HEIGHT - MARGIN - 14, subtitle)
+    c.drawRightString(PAGE_WIDTH - MARGIN, MARGIN / 2, f"Page {page_number}")
+
+
+def _draw_table(c, table, top):
+    _, height = table.wrapOn(c, PAGE_WIDTH - 2 * MARGIN, PAGE_HEIGHT)
+    table.drawOn(c, MARGIN, top - height)
+    return top - height
+
+
+def render_class_report(output, title, rows, subtitle='', progress=None):
+    """
+    Draws a tabular fee report onto `output` (a path or binary file object).
+
+    `rows` is any iterable of `(reg_number, name, student_class, expected_amount,
+    amount_paid, ...)` tuples, such as a streamed `fee_status_rows` query.
+    Rows are pulled one page at a time and each page is laid out as its own
+    `Table` with the column header repeated and a running-total row at the
+    bottom, so only a single page of rows is ever held in memory. The last
+    page ends with a summary of the whole report.
+
+    `progress(rows_done)` is called after each page. Returns the row count.
+    """
+    c = canvas.Canvas(output, pagesize=letter, pageCompression=1)
+    c.setTitle(title)
+
+    rows = iter(rows)
+    count = 0
+    total_expected = total_paid = total_outstanding = 0
+    page_number = 0
+    top = PAGE_HEIGHT - MARGIN - 30
+
+    chunk = list(islice(rows, ROWS_PER_PAGE))
+    while True:
+        page_number += 1
+        _draw_page_frame(c, title, subtitle, page_number)
+        data = [HEADER]
+        for reg_number, name, student_class, expected_amount, amount_paid, *_ in chunk:
+            count += 1
+            outstanding = max(expected_amount - amount_paid, 0)
+            total_expected += expected_amount
+            total_paid += amount_paid
+            total_outstanding += outstanding
+            data.append([
+                count,
+                _shorten(name, NAME_MAX_CHARS),
+                reg_number,
+                student_class,
+                _money(expected_amount),
+                _money(amount_paid),
+                _money(outstanding),
+            ])
+        if not chunk:
+            data.append(['', 'No students found for this report.', '', '', '', '', ''])
+        data.append(['', 'Running total', '', '', _money(total_expected), _money(total_paid), _money(total_outstanding)])
+
+        table = Table(data, colWidths=COL_WIDTHS, rowHeights=ROW_HEIGHT)
+        table.setStyle(PAGE_TABLE_STYLE)
+        bottom = _draw_table(c, table, top)
+
+        if progress:
+            progress(count)
+
+        # Read one page ahead so a full last page isn't followed by an empty one.
+        chunk = list(islice(rows, ROWS_PER_PAGE)) if len(chunk) == ROWS_PER_PAGE else []
+        if not chunk:
+            break
+        c.showPage()
+
+    # Summary footer, on a fresh page only when the last one is full.
+    summary = Table([
+        ['Students', str(count)],
+        ['Total expected', _money(total_expected)],
+        ['Total paid', _money(total_paid)],
+        ['Total outstanding', _money(total_outstanding)],
+    ], colWidths=[1.8 * inch, 1.6 * inch], rowHeights=ROW_HEIGHT + 2)
+    summary.setStyle(SUMMARY_TABLE_STYLE)
+    _, summary_height = summary.wrapOn(c, PAGE_WIDTH, PAGE_HEIGHT)
+    if bottom - 0.3 * inch - summary_height < MARGIN:
+        c.showPage()
+        page_number += 1
+        _draw_page_frame(c, title, subtitle, page_number)
+        bottom = top
+    _draw_table(c, summary, bottom - 0.3 * inch)
+
+    c.showPage()
+    c.save()
+    return count
+
+
+def report_title(report_type, student_class, academic_year, term):
+    return f"{REPORT_TYPES[report_type][1]} for {student_class} ({term} {academic_year})"
+
+
+def report_query(report_type, student_class, academic_year, term):
+    """
+    Column rows for a paid/unpaid class report, filtered by fee status in SQL.
+    """
+    status = REPORT_TYPES[report_type][0]
+    return fee_status_rows(
+        Student.query.filter_by(class_id=reference_data.class_id(student_class)),
+        reference_data.period_id(academic_year, term),
+        status=status
+    )
+
+
+def iter_report_rows(query):
+    """
+    Yields the rows of a report query ordered by name, fetched in keyset
+    batches. Each batch is read completely before it is yielded, so the
+    caller may commit between pages without breaking an open cursor.
+    """
+    after = None
+    while True:
+        page = keyset_paginate(
+            query,
+            [Student.name, Student.reg_number],
+            key=lambda row: (row.name, row.reg_number),
+            page_size=FETCH_BATCH_SIZE,
+            after=after
+        )
+        yield from page.items
+        if not page.has_next:
+            return
+        after = page.next_cursor
+
+
+def write_fee_report(output, report_type, student_class, academic_year, term, subtitle='', progress=None):
+    """
+    Renders a paid/unpaid class report to `output`. Returns the row count.
+    """
+    return render_class_report(
+        output,
+        report_title(report_type, student_class, academic_year, term),
+        iter_report_rows(report_query(report_type, student_class, academic_year, term)),
+        subtitle=subtitle,
+        progress=progress
+    )
@@ -1,7 +1,7 @@
 # Import necessary modules from Flask and Flask-Login
 import io
 import os
-from datetime import datetime
+from datetime import date, datetime
 from flask import (
     Blueprint,
     render_template,
@@ -11,41 +11,41 @@ from flask import (
     flash,
     abort,
     send_file,
-    current_app
+    current_app,
+    jsonify,
+    Response,
+    stream_with_context
 )
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import desc
-
-# For PDF generation
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib.utils import ImageReader
-from reportlab.lib.enums import TA_CENTER
+from sqlalchemy.orm import joinedload
 
 # Import models, constants, and helper functions from the 'app' package.
 from . import db, get_current_school_period
-from .models import User, Student, Payment, Teacher, Fee, Class
+from .models import User, Student, Payment, Teacher, Fee, Class, ReportJob
+from .fee_status import fee_status_query, fee_breakdown_query, students_with_fee_status
+from . import search
+from .pagination import keyset_paginate
+from .reports import REPORT_TYPES
+from . import jobs
+from . import receipts
+from .metrics import dashboard_metrics
+from .reg_numbers import next_reg_number
+from . import imports
+from . import exports
+from .money import to_naira
+from .passwords import PasswordServiceBusy
+from . import reference_data
+from . import database
+from .replica import reads_from_replica
+from . import periods
+from .periods import TERMS
 
 # ✅ FIX: Define the blueprint at the very top so it can be used below.
 main = Blueprint('main', __name__)
 
-# A new filter to format currency values for display in templates.
-@main.app_template_filter('format_currency')
-def format_currency_filter(value):
-    """
-    Formats a number as Nigerian Naira (₦) with commas for thousands.
-    """
-    if isinstance(value, (int, float)):
-        return f"₦{value:,.2f}"
-    return value
-
-# A dummy variable to be replaced with the actual school short name from config.
-# This should be defined in a separate config file for best practice.
-SCHOOL_SHORT_NAME = 'AAM'
+# Upper bound for the `per_page` query argument on paginated lists.
+MAX_PAGE_SIZE = 200
 
 def generate_reg_number():
     """
@@ -54,74 +54,18 @@ def generate_reg_number():
     Format: SCHOOL_SHORT_NAME/YY/NNNN
     Example: AAM/25/0001
     
-    This is a robust approach as it queries the database to find the last
-    used registration number, preventing duplicates.
+    Numbers come from the reg_number_sequences table, which hands them out
+    atomically, so concurrent registrations never get the same number. The
+    number is reserved in the current transaction and freed if it rolls back.
     """
     try:
-        current_year = datetime.now().strftime('%y')
-        
-        # Find the last student registered for the current year.
-        # We order by descending registration number to get the highest one.
-        last_student = Student.query.filter(
-            Student.reg_number.like(f'{SCHOOL_SHORT_NAME}/{current_year}/%')
-        ).order_by(desc(Student.reg_number)).first()
-
-        if last_student:
-            # Extract the numeric part of the last registration number
-            last_number_str = last_student.reg_number.split('/')[-1]
-            last_number = int(last_number_str)
-            next_number = last_number + 1
-        else:
-            # If no student exists for the year, start from 1
-            next_number = 1
-        
-        # Format the sequential number with leading zeros (e.g., 1 -> 0001)
-        formatted_number = f'{next_number:04d}'
-        
-        # Combine the parts to create the new registration number
-        return f'{SCHOOL_SHORT_NAME}/{current_year}/{formatted_number}'
-
+        return next_reg_number()
     except Exception as e:
+        db.session.rollback()
         print(f"Error generating registration number: {e}")
         # Return None or raise an error to prevent further execution
         return None
 
-def get_fee_status(student_reg_number, academic_year_check, term_check):
-    """
-    Calculates the fee status ('Paid', 'Defaulter', or 'N/A') for a student
-    for a given academic year and term.
-    
-    This is a great helper function that keeps the logic for determining
-    status separate from the main routes.
-    """
-    student = Student.query.get(student_reg_number)
-    
-    if not student:
-        return 'N/A'
-    
-    # Use the new Fee model to get the expected amount
-    expected_fee = Fee.query.filter_by(
-        student_class=student.student_class,
-        term=term_check,
-        academic_year=academic_year_check
-    ).first()
-    expected_amount = expected_fee.amount if expected_fee else 0.0
-
-    # Use db.func.sum() for an efficient database-side aggregation.
-    total_paid = db.session.query(db.func.sum(Payment.amount_paid)).filter(
-        Payment.student_reg_number == student_reg_number,
-        Payment.term == term_check,
-        Payment.academic_year == academic_year_check
-    ).scalar() or 0.0
-    
-    if expected_amount > 0:
-        if total_paid >= expected_amount:
-            return 'Paid'
-        else:
-            return 'Defaulter'
-    else:
-        return 'Paid'
-
 @main.route('/create_first_admin')
 def create_first_admin():
     """Route to create the initial admin user if one doesn't exist."""
@@ -131,9 +75,8 @@ def create_first_admin():
             flash('Admin user already exists. You can log in.', 'info')
             return redirect(url_for('main.login'))
 
-        # It's good practice to use a robust password hash.
-        hashed_password = generate_password_hash('admin')
-        first_admin = User(username='admin', password_hash=hashed_password, role='admin')
+        first_admin = User(username='admin', role='admin')
+        first_admin.password = 'admin'
         db.session.add(first_admin)
         db.session.commit()
         
@@ -147,6 +90,10 @@ def create_first_admin():
         
         flash('First admin user created successfully! And initial classes have been added. You can now log in.', 'success')
         return redirect(url_for('main.login'))
+    except PasswordServiceBusy:
+        db.session.rollback()
+        flash('The server is busy right now. Please try again in a moment.', 'error')
+        return render_template('login.html'), 503
     except Exception as e:
         db.session.rollback()
         flash(f'An error occurred: {str(e)}', 'error')
@@ -165,28 +112,17 @@ def dashboard():
     if current_user.role == 'officer':
         return render_template('official_dashboard.html')
     
-    # This is the admin dashboard logic.
-    total_students = db.session.query(Student).count()
-    total_fees_paid = db.session.query(db.func.sum(Payment.amount_paid)).scalar() or 0
-    total_teachers = db.session.query(Teacher).count()
-    total_officers = db.session.query(User).filter_by(role='officer').count()
-
-    # Query for the most recent 5 students.
-    students = Student.query.order_by(Student.admission_date.desc()).limit(5).all()
-    
-    current_academic_year, current_term = get_current_school_period()
-    students_with_status = []
-    for student in students:
-        student.fee_status = get_fee_status(student.reg_number, current_academic_year, current_term)
-        students_with_status.append(student)
+    # This is the admin dashboard logic. The figures come from the metrics
+    # cache, which session events clear whenever the underlying rows change.
+    metrics = dashboard_metrics()
 
     return render_template(
         'dashboard.html',
-        students=students_with_status,
-        total_students=total_students,
-        total_fees_paid=total_fees_paid,
-        total_teachers=total_teachers,
-        total_officers=total_officers
+        students=metrics['students'],
+        total_students=metrics['total_students'],
+        total_fees_paid=metrics['total_fees_paid'],
+        total_teachers=metrics['total_teachers'],
+        total_officers=metrics['total_officers']
     )
 
 @main.route('/login', methods=['GET', 'POST'])
@@ -199,8 +135,16 @@ def login():
         username = request.form['username']
         password = request.form['password']
         user = User.query.filter_by(username=username).first()
-        
-        if user and user.check_password(password):
+
+        try:
+            valid = user is not None and user.check_password(password)
+        except PasswordServiceBusy:
+            flash('Too many people are signing in right now. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503
+
+        if valid:
+            # Saves the upgraded hash if check_password replaced an old one.
+            db.session.commit()
             login_user(user)
             flash('Login successful!', 'success')
             return redirect(url_for('main.dashboard'))
@@ -219,7 +163,11 @@ def register():
             flash('Username already exists. Please choose a different one.', 'error')
         else:
             new_user = User(username=username, role='user')
-            new_user.password = password
+            try:
+                new_user.password = password
+            except PasswordServiceBusy:
+                flash('The server is busy right now. Please try again in a moment.', 'error')
+                return render_template('register.html'), 503
             db.session.add(new_user)
             db.session.commit()
             flash('Registration successful! You can now log in.', 'success')
@@ -242,7 +190,11 @@ def register_officer():
             flash('Username already exists. Please choose a different one.', 'error')
         else:
             new_officer = User(username=username, role='officer')
-            new_officer.password = password
+            try:
+                new_officer.password = password
+            except PasswordServiceBusy:
+                flash('The server is busy right now. Please try again in a moment.', 'error')
+                return render_template('register_officer.html'), 503
             db.session.add(new_officer)
             db.session.commit()
             flash(f'Officer {username} created successfully!', 'success')
@@ -290,6 +242,83 @@ def fees():
     all_fees = Fee.query.all()
     return render_template('fees.html', title='Manage Fees', fees=all_fees)
 
+@main.route('/fees/add', methods=['GET', 'POST'])
+@login_required
+def add_fee():
+    """Handles adding a fee amount for a class, term and academic year."""
+    if current_user.role != 'admin':
+        abort(403)
+
+    if request.method == 'POST':
+        student_class = request.form.get('student_class', '').strip()
+        term = request.form.get('term', '').strip()
+        academic_year = request.form.get('academic_year', '').strip()
+        amount_str = request.form.get('amount', '').strip()
+
+        if not all([student_class, term, academic_year, amount_str]):
+            flash('All fields are required.', 'error')
+            return redirect(url_for('main.add_fee'))
+        class_id = reference_data.class_id(student_class)
+        if class_id is None:
+            flash(f"The class '{student_class}' does not exist.", 'error')
+            return redirect(url_for('main.add_fee'))
+        try:
+            periods.period_values(academic_year, term)
+        except ValueError as e:
+            flash(f'{e}.', 'error')
+            return redirect(url_for('main.add_fee'))
+
+        try:
+            amount = to_naira(amount_str)
+            if amount < 0:
+                flash('Fee amount cannot be negative.', 'error')
+                return redirect(url_for('main.add_fee'))
+
+            new_fee = Fee(class_id=class_id, period_id=periods.ensure_period(academic_year, term), amount=amount)
+            db.session.add(new_fee)
+            # Existing balances for this class and period pick up the new fee in the same commit.
+            db.session.commit()
+            flash(f'Fee for {student_class} ({term} {academic_year}) added successfully!', 'success')
+            return redirect(url_for('main.fees'))
+        except ValueError:
+            flash('Invalid amount. Please enter a valid number.', 'error')
+        except IntegrityError:
+            db.session.rollback()
+            flash(f'A fee for {student_class} ({term} {academic_year}) already exists.', 'error')
+
+    classes = reference_data.class_names()
+    current_year_val = datetime.now().year
+    academic_years = [f"{y}/{y+1}" for y in range(current_year_val - 2, current_year_val + 3)]
+    return render_template('add_fee.html', title='Add Fee', classes=classes, academic_years=academic_years)
+
+@main.route('/fees/edit/<int:fee_id>', methods=['GET', 'POST'])
+@login_required
+def edit_fee(fee_id):
+    """Handles changing the amount of an existing fee."""
+    if current_user.role != 'admin':
+        abort(403)
+
+    fee = Fee.query.get_or_404(fee_id)
+
+    if request.method == 'POST':
+        try:
+            amount = to_naira(request.form.get('amount', '').strip())
+            if amount < 0:
+                flash('Fee amount cannot be negative.', 'error')
+            else:
+                fee.amount = amount
+                # Existing balances for this class and period are re-priced in the same commit.
+                db.session.commit()
+                flash(f'Fee for {fee.student_class} ({fee.term} {fee.academic_year}) updated successfully!', 'success')
+                return redirect(url_for('main.fees'))
+        except ValueError:
+            flash('Invalid amount. Please enter a valid number.', 'error')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error updating fee: {e}', 'error')
+
+    return render_template('edit_fee.html', title='Edit Fee', fee=fee)
+
 # --- END of NEW CODE ---
 
 @main.route('/reports')
@@ -299,13 +328,13 @@ def reports():
     if current_user.role != 'admin':
         abort(403)
     
-    current_academic_year, current_term = get_current_school_period()
-    all_classes = sorted(c.name for c in Class.query.all())
+    current_period = get_current_school_period()
+    all_classes = reference_data.class_names()
     
     return render_template(
         'reports.html',
-        current_academic_year=current_academic_year,
-        current_term=current_term,
+        current_academic_year=current_period.academic_year,
+        current_term=current_period.term,
         classes=all_classes
     )
     
@@ -313,8 +342,9 @@ def reports():
 @login_required
 def download_report(report_type):
     """
-    Generates and downloads a PDF report for paid or unpaid students
-    based on the selected criteria.
+    Queues a PDF report for paid or unpaid students based on the selected
+    criteria. The report is rendered in the background; this returns the
+    job id immediately (JSON) or redirects to the job's status page.
     """
     if current_user.role != 'admin':
         abort(403)
@@ -327,50 +357,58 @@ def download_report(report_type):
         flash('Please select academic year, term, and class for the report.', 'error')
         return redirect(url_for('main.reports'))
 
-    all_students_in_class = Student.query.filter_by(student_class=student_class).all()
-
-    report_title = ""
-    students_for_report = []
-
-    if report_type == 'paid':
-        report_title = f"Paid Students Report for {student_class} ({term} {academic_year})"
-        students_for_report = [
-            s for s in all_students_in_class
-            if get_fee_status(s.reg_number, academic_year, term) == 'Paid'
-        ]
-    elif report_type == 'unpaid':
-        report_title = f"Unpaid Students Report for {student_class} ({term} {academic_year})"
-        students_for_report = [
-            s for s in all_students_in_class
-            if get_fee_status(s.reg_number, academic_year, term) == 'Defaulter'
-        ]
-    else:
+    if report_type not in REPORT_TYPES:
         flash('Invalid report type.', 'error')
         return redirect(url_for('main.reports'))
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
+    job = jobs.enqueue_report(report_type, student_class, academic_year, term, current_user)
 
-    story.append(Paragraph(f"<b>{report_title}</b>", styles['h1']))
-    story.append(Spacer(1, 0.2 * inch))
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(_report_job_json(job)), 202
+    return redirect(url_for('main.report_job', job_id=job.id))
 
-    if not students_for_report:
-        story.append(Paragraph("No students found for this report.", styles['Normal']))
-    else:
-        for student in students_for_report:
-            story.append(Paragraph(f"<b>Name:</b> {student.name}", styles['Normal']))
-            story.append(Paragraph(f"<b>Reg Number:</b> {student.reg_number}", styles['Normal']))
-            story.append(Paragraph(f"<b>Class:</b> {student.student_class}", styles['Normal']))
-            story.append(Spacer(1, 0.1 * inch))
+def _get_report_job(job_id):
+    """Loads a report job. Reports are admin-only, like download_report."""
+    if current_user.role != 'admin':
+        abort(403)
+    return ReportJob.query.get_or_404(job_id)
+
+def _report_job_json(job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'percent': job.percent,
+        'error': job.error,
+        'status_url': url_for('main.report_job', job_id=job.id),
+        'download_url': url_for('main.download_report_job', job_id=job.id) if job.status == jobs.DONE else None,
+    }
+
+@main.route('/reports/jobs/<job_id>')
+@login_required
+def report_job(job_id):
+    """Shows the progress of a queued report, as JSON when asked for it."""
+    # Queues again any job whose worker stopped sending heartbeats.
+    jobs.recover_jobs()
+    job = _get_report_job(job_id)
 
-    doc.build(story)
-    buffer.seek(0)
-    
-    filename = f"{report_type}_report_{student_class}_{academic_year}_{term}.pdf"
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify(_report_job_json(job))
+    return render_template('report_job.html', title='Report Status', job=job)
+
+@main.route('/reports/jobs/<job_id>/download')
+@login_required
+def download_report_job(job_id):
+    """Downloads the PDF of a finished report job."""
+    job = _get_report_job(job_id)
+    if job.status != jobs.DONE or not job.result_path or not os.path.exists(job.result_path):
+        flash('This report is not ready yet.', 'info')
+        return redirect(url_for('main.report_job', job_id=job.id))
+
+    filename = f"{job.report_type}_report_{job.student_class}_{job.academic_year}_{job.term}.pdf"
     return send_file(
-        buffer,
+        job.result_path,
         as_attachment=True,
         download_name=filename,
         mimetype='application/pdf'
@@ -407,6 +445,16 @@ def register_student():
         if not all([name, dob, gender, address, phone, email, student_class, term, academic_year]):
             flash('All fields marked with * are required. Please fill in the form completely.', 'error')
             return redirect(url_for('main.register_student'))
+
+        try:
+            dob = datetime.strptime(dob, '%Y-%m-%d').date()
+        except ValueError:
+            flash('Please enter a valid date of birth.', 'error')
+            return redirect(url_for('main.register_student'))
+        class_id = reference_data.class_id(student_class)
+        if class_id is None:
+            flash(f"The class '{student_class}' does not exist.", 'error')
+            return redirect(url_for('main.register_student'))
         
         try:
             # Auto-generate the registration number
@@ -423,12 +471,13 @@ def register_student():
                 address=address,
                 phone=phone,
                 email=email,
-                student_class=student_class,
+                class_id=class_id,
                 term=term,
                 academic_year=academic_year,
-                admission_date=datetime.now().strftime('%Y-%m-%d')
+                admission_date=date.today()
             )
             db.session.add(new_student)
+            # Database triggers add the student to the search index in this commit.
             db.session.commit()
             flash(f'Student {name} registered successfully with Reg. Number: {reg_number}', 'success')
             return redirect(url_for('main.student_details', reg_number=reg_number))
@@ -441,48 +490,104 @@ def register_student():
             flash(f'An unexpected error occurred: {e}', 'error')
             return redirect(url_for('main.register_student'))
 
-    classes = sorted(c.name for c in Class.query.all())
-    terms = ['First Term', 'Second Term', 'Third Term']
+    classes = reference_data.class_names()
+    terms = TERMS
     current_year_val = datetime.now().year
     academic_years = [f"{y}/{y+1}" for y in range(current_year_val - 2, current_year_val + 3)]
 
     return render_template('register_student.html', classes=classes, terms=terms, academic_years=academic_years)
     
-@main.route('/students', defaults={'student_class': None})
-@main.route('/students/<student_class>')
+@main.route('/students/import', methods=('GET', 'POST'))
 @login_required
-def students(student_class):
+def import_students():
     """
-    Displays a list of students, with optional filtering by class, status, and search query.
+    Enrolls students in bulk from an uploaded CSV or XLSX file and shows a
+    summary with the rows that were rejected.
     """
+    if current_user.role != 'admin':
+        abort(403)
+
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV or XLSX file to import.', 'error')
+            return redirect(url_for('main.import_students'))
+        try:
+            result = imports.import_students(upload)
+        except imports.ImportFileError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('main.import_students'))
+        except Exception as e:
+            flash(f'The import stopped with an unexpected error: {e}', 'error')
+            return redirect(url_for('main.import_students'))
+
+    return render_template(
+        'import_students.html',
+        title='Import Students',
+        result=result,
+        columns=imports.STUDENT_COLUMNS
+    )
+
+def _student_directory_filters(student_class=None):
+    """Reads the /students filters from the request: (status, class, term, search)."""
     status_filter = request.args.get('status', 'all')
     class_filter = student_class or request.args.get('class', 'all')
     term_filter = request.args.get('term', 'all')
     search_query = request.args.get('search_query', '').strip()
+    return status_filter, class_filter, term_filter, search_query
 
+def _student_directory_query(class_filter, term_filter, search_query):
+    """The `Student` query behind the directory and its export, before fee status."""
     students_data = Student.query
     if class_filter != 'all':
-        students_data = students_data.filter_by(student_class=class_filter)
+        students_data = students_data.filter_by(class_id=reference_data.class_id(class_filter))
     if term_filter != 'all':
         students_data = students_data.filter_by(term=term_filter)
     if search_query:
-        students_data = students_data.filter(
-            (Student.name.like(f'%{search_query}%')) | 
-            (Student.reg_number.like(f'%{search_query}%'))
-        )
-    students_data = students_data.all()
-    
-    current_academic_year, current_term_for_status = get_current_school_period()
-    students_with_status = []
-    for student in students_data:
-        student.fee_status = get_fee_status(student.reg_number, current_academic_year, current_term_for_status)
-        students_with_status.append(student)
+        students_data = search.filter_students(students_data, search_query)
+    return students_data
+
+@main.route('/students', defaults={'student_class': None})
+@main.route('/students/<student_class>')
+@login_required
+@reads_from_replica
+def students(student_class):
+    """
+    Displays a list of students, with optional filtering by class, status, and search query.
+    """
+    status_filter, class_filter, term_filter, search_query = _student_directory_filters(student_class)
+    students_data = _student_directory_query(class_filter, term_filter, search_query)
+
+    # Fee status is computed and filtered in SQL as part of the same query.
+    students_query = fee_status_query(
+        students_data,
+        get_current_school_period().id,
+        status=status_filter if status_filter != 'all' else None
+    )
+
+    # Keyset pagination: each page seeks past the previous page's last row on
+    # the (class_id, name, reg_number) index instead of using OFFSET.
+    per_page = request.args.get('per_page', current_app.config['STUDENTS_PAGE_SIZE'], type=int)
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    page = keyset_paginate(
+        students_query,
+        [Student.class_id, Student.name, Student.reg_number],
+        key=lambda row: (row[0].class_id, row[0].name, row[0].reg_number),
+        page_size=per_page,
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
+    students_with_status = students_with_fee_status(page.items)
 
-    if status_filter != 'all':
-        students_with_status = [s for s in students_with_status if s.fee_status == status_filter]
+    def page_url(**cursor):
+        # Keep every active filter and only swap the cursor.
+        args = {k: v for k, v in request.args.items() if k not in ('after', 'before')}
+        args.update(cursor)
+        return url_for('main.students', student_class=student_class, **args)
 
-    all_classes = sorted(c.name for c in Class.query.all())
-    all_terms = ['First Term', 'Second Term', 'Third Term']
+    all_classes = reference_data.class_names()
+    all_terms = TERMS
 
     return render_template(
         'students.html',
@@ -492,7 +597,56 @@ def students(student_class):
         term_filter=term_filter,
         search_query=search_query,
         classes=all_classes,
-        terms=all_terms
+        terms=all_terms,
+        per_page=per_page,
+        export_args={'class': class_filter, 'term': term_filter, 'status': status_filter, 'search_query': search_query},
+        next_url=page_url(after=page.next_cursor) if page.has_next else None,
+        prev_url=page_url(before=page.prev_cursor) if page.has_prev else None
+    )
+
+@main.route('/students/export')
+@login_required
+@reads_from_replica
+def export_students():
+    """
+    Downloads the student directory with fee figures as CSV (default) or
+    XLSX (?format=xlsx). Takes the same class, term, status and search
+    filters as /students. The fee figures are for the current period unless
+    `academic_year` and `fee_term` are given.
+    """
+    if current_user.role not in ['admin', 'officer']:
+        abort(403)
+
+    status_filter, class_filter, term_filter, search_query = _student_directory_filters()
+    current_period = get_current_school_period()
+    academic_year = request.args.get('academic_year') or current_period.academic_year
+    fee_term = request.args.get('fee_term') or current_period.term
+
+    rows = exports.student_directory_rows(
+        _student_directory_query(class_filter, term_filter, search_query),
+        reference_data.period_id(academic_year, fee_term),
+        status=status_filter if status_filter != 'all' else None
+    )
+    filename = f"students_{academic_year.replace('/', '-')}_{fee_term.replace(' ', '_')}"
+
+    if request.args.get('format') == 'xlsx':
+        try:
+            body = exports.stream_xlsx(rows)
+        except ImportError:
+            flash("Excel export needs the 'openpyxl' package. Download CSV instead.", 'error')
+            return redirect(url_for('main.students'))
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        filename += '.xlsx'
+    else:
+        body = exports.stream_csv(rows)
+        mimetype = 'text/csv'
+        filename += '.csv'
+
+    # Rows are read from a server-side cursor while the response is sent.
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
 @main.route('/student/<path:reg_number>')
@@ -502,69 +656,33 @@ def student_details(reg_number):
     student = Student.query.get_or_404(reg_number)
     payments = Payment.query.filter_by(student_reg_number=reg_number).all()
     
-    current_academic_year, current_term = get_current_school_period()
-    student_fee_status = get_fee_status(reg_number, current_academic_year, current_term)
-    
-    fee_breakdown = {}
-    all_years_terms = set()
-    
-    if student.academic_year and student.term:
-        all_years_terms.add((student.academic_year, student.term))
-    for p in payments:
-        all_years_terms.add((p.academic_year, p.term))
-    all_years_terms.add((current_academic_year, current_term))
-    
-    for year, term in sorted(list(all_years_terms)):
-        expected_fee_obj = Fee.query.filter_by(
-            student_class=student.student_class,
-            term=term,
-            academic_year=year
-        ).first()
-        expected_amount = expected_fee_obj.amount if expected_fee_obj else 0.0
-
-        total_paid_for_period = db.session.query(db.func.sum(Payment.amount_paid)).filter(
-            Payment.student_reg_number == reg_number,
-            Payment.term == term,
-            Payment.academic_year == year
-        ).scalar() or 0.0
-        
-        outstanding_amount = expected_amount - total_paid_for_period
+    current_period = get_current_school_period()
 
-        fee_breakdown[f"{term} {year}"] = {
-            'expected': expected_amount,
-            'paid': total_paid_for_period,
-            'outstanding': outstanding_amount
-        }
-    
-    def sort_key_for_fee_breakdown(item):
-        period_str = item[0]
-        parts = period_str.split(' ')
-        term_name = ' '.join(parts[:-1]) if len(parts) > 1 else parts[0]
-        year_part = parts[-1] if len(parts) > 1 else ""
-        
-        try:
-            start_year = int(year_part.split('/')[0])
-        except (ValueError, IndexError):
-            start_year = 0
-        
-        term_order = ['First Term', 'Second Term', 'Third Term']
-        try:
-            term_index = term_order.index(term_name)
-        except ValueError:
-            term_index = -1
-        
-        return (start_year, term_index)
+    # Terms with payments, plus the current and admission terms, newest first.
+    period_ids = [current_period.id]
+    admission_period_id = reference_data.period_id(student.academic_year, student.term)
+    if admission_period_id is not None:
+        period_ids.append(admission_period_id)
 
-    sorted_fee_breakdown = sorted(fee_breakdown.items(), key=sort_key_for_fee_breakdown, reverse=True)
-    sorted_fee_breakdown_dict = {k: v for k, v in sorted_fee_breakdown}
+    # One grouped query; the current term's status comes from the same rows.
+    fee_breakdown = {}
+    student_fee_status = 'N/A'
+    for row in fee_breakdown_query(student, period_ids):
+        fee_breakdown[f"{row.term} {row.academic_year}"] = {
+            'expected': row.expected_amount,
+            'paid': row.amount_paid,
+            'outstanding': row.expected_amount - row.amount_paid
+        }
+        if row.id == current_period.id:
+            student_fee_status = row.fee_status
 
     return render_template('student_details.html',
                            student=student,
                            payments=payments,
                            fee_status=student_fee_status,
-                           fee_breakdown=sorted_fee_breakdown_dict,
-                           current_academic_year=current_academic_year,
-                           current_term=current_term
+                           fee_breakdown=fee_breakdown,
+                           current_academic_year=current_period.academic_year,
+                           current_term=current_period.term
                            )
 
 @main.route('/make_payment/<path:reg_number>', methods=['GET', 'POST'])
@@ -581,22 +699,27 @@ def make_payment(reg_number):
         term = request.form['term'].strip()
         academic_year = request.form['academic_year'].strip()
         recorded_by_user = current_user.id
-        
         try:
-            amount_paid = float(amount_str)
+            periods.period_values(academic_year, term)
+        except ValueError:
+            flash('Please select the term and academic year this payment is for.', 'error')
+            return redirect(url_for('main.make_payment', reg_number=reg_number))
+
+        try:
+            amount_paid = to_naira(amount_str)
             if amount_paid <= 0:
                 flash('Payment amount must be positive.', 'error')
             else:
-                payment_date = datetime.now().strftime('%Y-%m-%d')
+                payment_date = date.today()
                 new_payment = Payment(
                     student_reg_number=reg_number,
-                    term=term,
-                    academic_year=academic_year,
+                    period_id=periods.ensure_period(academic_year, term),
                     amount_paid=amount_paid,
                     payment_date=payment_date,
                     recorded_by=recorded_by_user
                 )
                 db.session.add(new_payment)
+                # The student's balance ledger row is updated in this same commit.
                 db.session.commit()
                 flash(f'Payment of ₦{amount_paid:,.2f} recorded for {student.name} for {term} {academic_year}.', 'success')
                 return redirect(url_for('main.student_details', reg_number=reg_number))
@@ -606,18 +729,138 @@ def make_payment(reg_number):
             db.session.rollback()
             flash(f'Database error: {e}', 'error')
 
-    terms = ['First Term', 'Second Term', 'Third Term']
+    terms = TERMS
     current_year_val = datetime.now().year
     academic_years = [f"{y}/{y+1}" for y in range(current_year_val - 2, current_year_val + 3)]
     
-    pre_selected_academic_year, pre_selected_term = get_current_school_period()
+    current_period = get_current_school_period()
 
     return render_template('make_payment.html',
                            student=student,
                            terms=terms,
                            academic_years=academic_years,
-                           pre_selected_term=pre_selected_term,
-                           pre_selected_academic_year=pre_selected_academic_year)
+                           pre_selected_term=current_period.term,
+                           pre_selected_academic_year=current_period.academic_year)
+
+@main.route('/payments')
+@login_required
+def payments():
+    """
+    Payment ledger for a date range (default: today), optionally limited to
+    the payments one user recorded, for the cashier's end-of-day
+    reconciliation. The count and total cover the whole selection; the rows
+    are paged in the order they were taken.
+    """
+    if current_user.role not in ['admin', 'officer']:
+        abort(403)
+
+    today = date.today().isoformat()
+    try:
+        date_from = datetime.strptime(request.args.get('date_from') or today, '%Y-%m-%d').date()
+        date_to = datetime.strptime(request.args.get('date_to') or today, '%Y-%m-%d').date()
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format.', 'error')
+        return redirect(url_for('main.payments'))
+    recorded_by = request.args.get('recorded_by', type=int)
+
+    # Served by the (payment_date, recorded_by) index.
+    payments_query = Payment.query.filter(Payment.payment_date.between(date_from, date_to))
+    if recorded_by:
+        payments_query = payments_query.filter(Payment.recorded_by == recorded_by)
+
+    payment_count, total_paid = payments_query.with_entities(
+        db.func.count(Payment.id),
+        db.func.coalesce(db.func.sum(Payment.amount_paid), 0)
+    ).one()
+
+    per_page = request.args.get('per_page', current_app.config['STUDENTS_PAGE_SIZE'], type=int)
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    page = keyset_paginate(
+        payments_query.options(joinedload(Payment.student), joinedload(Payment.recorder)),
+        [Payment.payment_date, Payment.id],
+        key=lambda payment: (payment.payment_date, payment.id),
+        page_size=per_page,
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
+
+    def page_url(**cursor):
+        args = {k: v for k, v in request.args.items() if k not in ('after', 'before')}
+        args.update(cursor)
+        return url_for('main.payments', **args)
+
+    recorders = User.query.filter(User.role.in_(['admin', 'officer'])).order_by(User.username).all()
+
+    return render_template(
+        'payments.html',
+        title='Payments',
+        payments=page.items,
+        payment_count=payment_count,
+        total_paid=total_paid,
+        date_from=date_from,
+        date_to=date_to,
+        recorded_by=recorded_by,
+        recorders=recorders,
+        next_url=page_url(after=page.next_cursor) if page.has_next else None,
+        prev_url=page_url(before=page.prev_cursor) if page.has_prev else None
+    )
+
+@main.route('/payments/import', methods=('GET', 'POST'))
+@login_required
+def import_payments():
+    """
+    Records payments in bulk from an uploaded bank statement and shows a
+    reconciliation of matched, duplicate, ambiguous and unmatched lines.
+    """
+    if current_user.role not in ['admin', 'officer']:
+        abort(403)
+
+    terms = TERMS
+    current_year_val = datetime.now().year
+    academic_years = [f"{y}/{y+1}" for y in range(current_year_val - 2, current_year_val + 3)]
+    current_period = get_current_school_period()
+    selected_academic_year, selected_term = current_period.academic_year, current_period.term
+    dry_run = False
+    result = None
+
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        selected_term = request.form.get('term', '').strip()
+        selected_academic_year = request.form.get('academic_year', '').strip()
+        dry_run = bool(request.form.get('dry_run'))
+
+        if not upload or not upload.filename:
+            flash('Please choose a bank statement file to import.', 'error')
+            return redirect(url_for('main.import_payments'))
+        if selected_term not in terms or selected_academic_year not in academic_years:
+            flash('Please select the term and academic year these payments are for.', 'error')
+            return redirect(url_for('main.import_payments'))
+
+        try:
+            result = imports.import_statement(
+                upload,
+                selected_academic_year,
+                selected_term,
+                current_user,
+                dry_run=dry_run
+            )
+        except imports.ImportFileError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('main.import_payments'))
+        except Exception as e:
+            flash(f'The import stopped with an unexpected error: {e}', 'error')
+            return redirect(url_for('main.import_payments'))
+
+    return render_template(
+        'import_payments.html',
+        title='Import Payments',
+        result=result,
+        dry_run=dry_run,
+        terms=terms,
+        academic_years=academic_years,
+        selected_term=selected_term,
+        selected_academic_year=selected_academic_year
+    )
 
 @main.route('/edit_student/<path:reg_number>', methods=['GET', 'POST'])
 @login_required
@@ -629,25 +872,38 @@ def edit_student(reg_number):
         abort(403)
     
     if request.method == 'POST':
+        student_class = request.form['class'].strip()
+        class_id = reference_data.class_id(student_class)
         try:
-            student.name = request.form['name'].strip()
-            student.dob = request.form['dob'].strip()
-            student.gender = request.form['gender'].strip()
-            student.address = request.form['address'].strip()
-            student.phone = request.form['phone'].strip()
-            student.email = request.form['email'].strip()
-            student.student_class = request.form['class'].strip()
-            student.term = request.form['term'].strip()
-            student.academic_year = request.form['academic_year'].strip()
-            db.session.commit()
-            flash(f'Student {student.name} updated successfully!', 'success')
-            return redirect(url_for('main.student_details', reg_number=reg_number))
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Error updating student: {e}', 'error')
+            dob = datetime.strptime(request.form['dob'].strip(), '%Y-%m-%d').date()
+        except ValueError:
+            dob = None
 
-    classes = sorted(c.name for c in Class.query.all())
-    terms = ['First Term', 'Second Term', 'Third Term']
+        if dob is None:
+            flash('Please enter a valid date of birth.', 'error')
+        elif class_id is None:
+            flash(f"The class '{student_class}' does not exist.", 'error')
+        else:
+            try:
+                student.name = request.form['name'].strip()
+                student.dob = dob
+                student.gender = request.form['gender'].strip()
+                student.address = request.form['address'].strip()
+                student.phone = request.form['phone'].strip()
+                student.email = request.form['email'].strip()
+                student.class_id = class_id
+                student.term = request.form['term'].strip()
+                student.academic_year = request.form['academic_year'].strip()
+                # A class change re-prices the student's balance ledger rows in the same commit.
+                db.session.commit()
+                flash(f'Student {student.name} updated successfully!', 'success')
+                return redirect(url_for('main.student_details', reg_number=reg_number))
+            except Exception as e:
+                db.session.rollback()
+                flash(f'Error updating student: {e}', 'error')
+
+    classes = reference_data.class_names()
+    terms = TERMS
     current_year_val = datetime.now().year
     academic_years = [f"{y}/{y+1}" for y in range(current_year_val - 2, current_year_val + 3)]
 
@@ -655,6 +911,7 @@ def edit_student(reg_number):
 
 @main.route('/search_students', methods=['GET'])
 @login_required
+@reads_from_replica
 def search_students():
     """
     Handles student search requests by name or registration number.
@@ -663,11 +920,8 @@ def search_students():
     search_query = request.args.get('query', '').strip()
 
     if search_query:
-        # Good use of filtering with 'like' for flexible searching.
-        results = Student.query.filter(
-            (Student.name.like(f'%{search_query}%')) |
-            (Student.reg_number.like(f'%{search_query}%'))
-        ).order_by(Student.name).all()
+        # Ranked, prefix-aware matching served by the full-text search index.
+        results = search.search_students(search_query).all()
     else:
         results = []
 
@@ -677,77 +931,78 @@ def search_students():
 @login_required
 def download_receipt(payment_id):
     """
-    Generates a PDF payment receipt for a given payment ID and sends it as a download.
+    Sends the PDF receipt for a payment, rendering it only if no cached copy
+    matches the payment's current details.
     """
-    payment = Payment.query.get_or_404(payment_id)
-    student = Student.query.filter_by(reg_number=payment.student_reg_number).first_or_404()
-    recorded_by_user = User.query.get_or_404(payment.recorded_by)
-
-    # In-memory PDF generation is a clean and efficient approach.
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
+    fields = receipts.receipt_fields(payment_id)
+    if fields is None:
+        abort(404)
+
+    # Cached receipts are keyed by their printed fields, so a hit is always current.
+    cache = receipts.get_receipt_cache()
+    cached = cache.open(fields)
+    if cached is not None:
+        body = cached
+    else:
+        data = receipts.build_receipt_pdf(fields)
+        cache.put(fields, data)
+        body = io.BytesIO(data)
 
-    # School Header
-    school_name = "ALFURQAN ACADEMY"
-    school_address = "Galadima Road, Mai'adua"
-    
-    # NOTE: The following lines that attempted to load a logo have been removed to fix the OSError.
-    # The receipt will now be generated without the school logo.
-    
-    school_name_style = ParagraphStyle(
-        'SchoolName',
-        parent=styles['h1'],
-        alignment=TA_CENTER,
-        fontSize=20,
-        spaceAfter=6,
-    )
-    story.append(Paragraph(f"<b>{school_name}</b>", school_name_style))
-    
-    school_address_style = ParagraphStyle(
-        'SchoolAddress',
-        parent=styles['Normal'],
-        alignment=TA_CENTER,
-        fontSize=12,
-        spaceAfter=12,
+    return send_file(
+        body,
+        as_attachment=True,
+        download_name=receipts.receipt_filename(fields),
+        mimetype='application/pdf'
     )
-    story.append(Paragraph(school_address, school_address_style))
-    story.append(Spacer(1, 0.1 * inch))
 
+@main.route('/download_receipts')
+@login_required
+def download_receipts():
+    """
+    Downloads the receipts of every payment matching the selected class,
+    term, academic year and/or payment date range: one multi-page PDF by
+    default, or a streamed ZIP of individual receipts with ?format=zip.
+    """
+    if current_user.role not in ['admin', 'officer']:
+        abort(403)
 
-    # Title
-    receipt_title_style = ParagraphStyle(
-        'ReceiptTitle',
-        parent=styles['h2'],
-        alignment=TA_CENTER,
-        spaceAfter=12,
-    )
-    story.append(Paragraph("<b>Payment Receipt</b>", receipt_title_style))
-    story.append(Spacer(1, 0.2 * inch))
-
-    # Payment details
-    story.append(Paragraph(f"<b>Student Name:</b> {student.name}", styles['Normal']))
-    story.append(Paragraph(f"<b>Registration Number:</b> {student.reg_number}", styles['Normal']))
-    story.append(Paragraph(f"<b>Class:</b> {student.student_class}", styles['Normal']))
-    story.append(Spacer(1, 0.1 * inch))
-    story.append(Paragraph(f"<b>Amount Paid:</b> ₦{payment.amount_paid:,.2f}", styles['Normal']))
-    story.append(Paragraph(f"<b>Payment Date:</b> {payment.payment_date}", styles['Normal']))
-    story.append(Paragraph(f"<b>Term:</b> {payment.term}", styles['Normal']))
-    story.append(Paragraph(f"<b>Academic Year:</b> {payment.academic_year}", styles['Normal']))
-    story.append(Spacer(1, 0.4 * inch))
-    story.append(Paragraph(f"<b>Recorded By:</b> {recorded_by_user.username}", styles['Normal']))
-    story.append(Spacer(1, 0.4 * inch))
-    story.append(Paragraph("<i>Thank you for your payment.</i>", styles['Italic']))
-
-    doc.build(story)
+    filters = {
+        key: request.args.get(key, '').strip() or None
+        for key in ('student_class', 'term', 'academic_year', 'date_from', 'date_to')
+    }
+    back_url = request.referrer or url_for('main.dashboard')
+
+    if not any(filters.values()):
+        flash('Please select a class, term, academic year or date range for the receipts.', 'error')
+        return redirect(back_url)
+    try:
+        for key in ('date_from', 'date_to'):
+            if filters[key]:
+                filters[key] = datetime.strptime(filters[key], '%Y-%m-%d').date()
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format.', 'error')
+        return redirect(back_url)
+
+    rows = receipts.receipt_rows(**filters)
+
+    if request.args.get('format') == 'zip':
+        # Streamed as each receipt is rendered; the query cursor stays open meanwhile.
+        return Response(
+            stream_with_context(receipts.stream_receipts_zip(rows)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': 'attachment; filename=receipts.zip'}
+        )
+
+    buffer = io.BytesIO()
+    if not receipts.write_receipts_pdf(buffer, rows):
+        flash('No payments match the selected criteria.', 'info')
+        return redirect(back_url)
     buffer.seek(0)
 
-    filename = f"receipt_{student.name.replace(' ', '_')}_{payment.id}.pdf"
     return send_file(
         buffer,
         as_attachment=True,
-        download_name=filename,
+        download_name='receipts.pdf',
         mimetype='application/pdf'
     )
 
@@ -768,13 +1023,20 @@ def add_teacher():
     if request.method == 'POST':
         # Assuming you have a form for this. For this example, we'll use a simplified version.
         name = request.form['name']
-        class_taught = request.form['class_taught']
+        class_taught = request.form.get('class_taught', '').strip()
         email = request.form['email']
         phone = request.form['phone']
-        
+
+        class_id = None
+        if class_taught:
+            class_id = reference_data.class_id(class_taught)
+            if class_id is None:
+                flash(f"The class '{class_taught}' does not exist.", 'error')
+                return redirect(url_for('main.add_teacher'))
+
         teacher = Teacher(
             name=name,
-            class_taught=class_taught,
+            class_id=class_id,
             email=email,
             phone=phone
         )
@@ -847,11 +1109,18 @@ def delete_class(class_id):
     
     try:
         # Check if there are any students in this class
-        student_count = Student.query.filter_by(student_class=class_to_delete.name).count()
+        student_count = Student.query.filter_by(class_id=class_to_delete.id).count()
         if student_count > 0:
             flash(f'Cannot delete class "{class_to_delete.name}". It still has {student_count} students.', 'error')
             return redirect(url_for('main.manage_classes'))
 
+        # Fees and teachers also point at the class by id.
+        fee_count = Fee.query.filter_by(class_id=class_to_delete.id).count()
+        teacher_count = Teacher.query.filter_by(class_id=class_to_delete.id).count()
+        if fee_count or teacher_count:
+            flash(f'Cannot delete class "{class_to_delete.name}". It still has {fee_count} fees and {teacher_count} teachers.', 'error')
+            return redirect(url_for('main.manage_classes'))
+
         db.session.delete(class_to_delete)
         db.session.commit()
         flash(f'Class "{class_to_delete.name}" deleted successfully!', 'success')
@@ -886,7 +1155,8 @@ def edit_class(class_id):
             return redirect(url_for('main.edit_class', class_id=class_id))
             
         try:
-            # Update the class name in the database
+            # Students, fees and teachers refer to the class by id, so a
+            # rename is a single-row update.
             class_to_edit.name = new_name
             db.session.commit()
             flash(f'Class updated to "{new_name}" successfully!', 'success')
@@ -896,3 +1166,11 @@ def edit_class(class_id):
             flash(f'An error occurred while updating the class: {e}', 'error')
             
     return render_template('edit_class.html', title='Edit Class', class_obj=class_to_edit)
+
+@main.route('/admin/database')
+@login_required
+def database_stats():
+    """Connection pool counters for each database, as JSON."""
+    if current_user.role != 'admin':
+        abort(403)
+    return jsonify(database.pool_stats())
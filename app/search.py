@@ -0,0 +1,161 @@
+import re
+
+import click
+from sqlalchemy import case, column, literal_column, or_, select, table
+
+from . import db
+from .models import Student
+
+# FTS5 index over students, created by the search migration on SQLite and
+# kept in sync by triggers on the students table.
+student_search = table('student_search', column('reg_number'), column('name'))
+
+# Detected backend per database URL. Cleared by rebuild_search_index().
+_backend_cache = {}
+
+
+def _backend():
+    """
+    Picks the search backend for the current database:
+    'fts5' on SQLite, 'trigram' on Postgres and plain 'like' otherwise.
+    """
+    engine = db.session.get_bind()
+    dialect = engine.dialect.name
+    if dialect == 'postgresql':
+        return 'trigram'
+    if dialect != 'sqlite':
+        return 'like'
+
+    key = str(engine.url)
+    if key not in _backend_cache:
+        has_index = db.session.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'student_search'"
+        )).first()
+        _backend_cache[key] = 'fts5' if has_index else 'like'
+    return _backend_cache[key]
+
+
+def _tokens(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def _fts_query(text):
+    """
+    Turns user input into an FTS5 query where every word is a prefix match,
+    e.g. 'aam/25/00' -> '"aam"* "25"* "00"*'.
+    """
+    return ' '.join(f'"{token}"*' for token in _tokens(text))
+
+
+def _like_pattern(text, prefix=False):
+    escaped = text.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'{escaped}%' if prefix else f'%{escaped}%'
+
+
+def _like_filter(text):
+    pattern = _like_pattern(text)
+    return or_(
+        db.func.lower(Student.name).like(pattern, escape='\\'),
+        db.func.lower(Student.reg_number).like(pattern, escape='\\')
+    )
+
+
+def _fts_matches(text):
+    return (
+        select(
+            student_search.c.reg_number,
+            literal_column('bm25(student_search)').label('rank')
+        )
+        .where(literal_column('student_search').op('MATCH')(_fts_query(text)))
+        .subquery()
+    )
+
+
+def filter_students(student_query, text):
+    """
+    Restricts a `Student` query to students whose name or registration number
+    matches `text`, without changing its ordering.
+    """
+    text = text.strip()
+    if not text:
+        return student_query
+
+    backend = _backend()
+    if backend == 'fts5':
+        if not _tokens(text):
+            return student_query.filter(db.false())
+        return student_query.filter(Student.reg_number.in_(
+            select(_fts_matches(text).c.reg_number)
+        ))
+    # The Postgres trigram indexes serve the same LIKE filter.
+    return student_query.filter(_like_filter(text))
+
+
+def search_students(text, student_query=None):
+    """
+    Returns a `Student` query for `text`, best matches first.
+
+    Matching is prefix-aware on each word of the name and registration
+    number: FTS5 with bm25 ranking on SQLite, trigram similarity on Postgres
+    and a plain LIKE scan on anything else.
+    """
+    if student_query is None:
+        student_query = Student.query
+    text = text.strip()
+    if not text:
+        return student_query.filter(db.false())
+
+    backend = _backend()
+    if backend == 'fts5':
+        if not _tokens(text):
+            return student_query.filter(db.false())
+        matches = _fts_matches(text)
+        return (
+            student_query
+            .join(matches, matches.c.reg_number == Student.reg_number)
+            .order_by(matches.c.rank, Student.name)
+        )
+
+    query = student_query.filter(_like_filter(text))
+    if backend == 'trigram':
+        prefix = _like_pattern(text, prefix=True)
+        name = db.func.lower(Student.name)
+        reg_number = db.func.lower(Student.reg_number)
+        starts_with = case(
+            (or_(name.like(prefix, escape='\\'), reg_number.like(prefix, escape='\\')), 0),
+            else_=1
+        )
+        similarity = db.func.greatest(
+            db.func.similarity(name, text.lower()),
+            db.func.similarity(reg_number, text.lower())
+        )
+        return query.order_by(starts_with, similarity.desc(), Student.name)
+    return query.order_by(Student.name)
+
+
+def rebuild_search_index():
+    """
+    Repopulates the SQLite FTS5 index from the students table and commits.
+    Postgres trigram indexes are maintained by the database itself.
+    """
+    _backend_cache.clear()
+    if _backend() != 'fts5':
+        return 0
+    db.session.execute(db.text('DELETE FROM student_search'))
+    db.session.execute(db.text(
+        'INSERT INTO student_search (rowid, reg_number, name) '
+        'SELECT rowid, reg_number, name FROM students'
+    ))
+    db.session.commit()
+    return db.session.query(Student).count()
+
+
+def init_app(app):
+    """
+    Registers the search index CLI commands.
+    """
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Repopulate the student full-text search index."""
+        count = rebuild_search_index()
+        click.echo(f'Indexed {count} students.')
@@ -0,0 +1,96 @@
+# benchmark_receipts.py
+import io
+import sys
+import time
+
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+from app import create_app, db
+from app.models import User, Student, Payment
+from app.receipts import receipt_fields, build_receipt_pdf
+
+# Compares the canvas receipt engine used by download_receipt with the
+# SimpleDocTemplate flow it replaced. Neither path touches the receipt cache.
+# Usage: python benchmark_receipts.py [rounds]
+
+app = create_app()
+
+
+def old_download_receipt(payment_id):
+    """
+    The previous download_receipt body: three lookups, fresh styles and a
+    platypus layout for every receipt.
+    """
+    payment = db.session.get(Payment, payment_id)
+    student = Student.query.filter_by(reg_number=payment.student_reg_number).first()
+    recorded_by_user = db.session.get(User, payment.recorded_by)
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = []
+
+    school_name_style = ParagraphStyle('SchoolName', parent=styles['h1'], alignment=TA_CENTER, fontSize=20, spaceAfter=6)
+    story.append(Paragraph("<b>ALFURQAN ACADEMY</b>", school_name_style))
+    school_address_style = ParagraphStyle('SchoolAddress', parent=styles['Normal'], alignment=TA_CENTER, fontSize=12, spaceAfter=12)
+    story.append(Paragraph("Galadima Road, Mai'adua", school_address_style))
+    story.append(Spacer(1, 0.1 * inch))
+    receipt_title_style = ParagraphStyle('ReceiptTitle', parent=styles['h2'], alignment=TA_CENTER, spaceAfter=12)
+    story.append(Paragraph("<b>Payment Receipt</b>", receipt_title_style))
+    story.append(Spacer(1, 0.2 * inch))
+
+    story.append(Paragraph(f"<b>Student Name:</b> {student.name}", styles['Normal']))
+    story.append(Paragraph(f"<b>Registration Number:</b> {student.reg_number}", styles['Normal']))
+    story.append(Paragraph(f"<b>Class:</b> {student.student_class}", styles['Normal']))
+    story.append(Spacer(1, 0.1 * inch))
+    story.append(Paragraph(f"<b>Amount Paid:</b> ₦{payment.amount_paid:,.2f}", styles['Normal']))
+    story.append(Paragraph(f"<b>Payment Date:</b> {payment.payment_date}", styles['Normal']))
+    story.append(Paragraph(f"<b>Term:</b> {payment.term}", styles['Normal']))
+    story.append(Paragraph(f"<b>Academic Year:</b> {payment.academic_year}", styles['Normal']))
+    story.append(Spacer(1, 0.4 * inch))
+    story.append(Paragraph(f"<b>Recorded By:</b> {recorded_by_user.username}", styles['Normal']))
+    story.append(Spacer(1, 0.4 * inch))
+    story.append(Paragraph("<i>Thank you for your payment.</i>", styles['Italic']))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def new_download_receipt(payment_id):
+    """
+    The current uncached path: one joined query and the canvas engine.
+    """
+    return build_receipt_pdf(receipt_fields(payment_id))
+
+
+def run(name, render, payment_ids, rounds):
+    render(payment_ids[0])  # warm up imports, fonts and the logo cache
+    started = time.perf_counter()
+    size = 0
+    for _ in range(rounds):
+        for payment_id in payment_ids:
+            size += len(render(payment_id))
+    elapsed = time.perf_counter() - started
+    count = rounds * len(payment_ids)
+    print(f"{name:<28} {count / elapsed:8.1f} receipts/s  {elapsed / count * 1000:7.2f} ms each  {size // count:6d} bytes avg")
+    return count / elapsed
+
+
+def benchmark(rounds):
+    with app.app_context():
+        payment_ids = [payment_id for (payment_id,) in db.session.query(Payment.id).order_by(Payment.id).limit(50)]
+        if not payment_ids:
+            print("No payments found. Record a payment first.")
+            return
+        print(f"Rendering {len(payment_ids)} payments x {rounds} rounds")
+        old = run("SimpleDocTemplate (old)", old_download_receipt, payment_ids, rounds)
+        new = run("canvas engine (current)", new_download_receipt, payment_ids, rounds)
+        print(f"Speed-up: {new / old:.1f}x")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,43 @@
+"""Add report_jobs queue table
+
+Revision ID: 175ebdec78ab
+Revises: dd3d26c7b082
+Create Date: 2026-10-16 13:40:52.118034
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '175ebdec78ab'
+down_revision = 'dd3d26c7b082'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('report_jobs',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('report_type', sa.String(length=20), nullable=False),
+    sa.Column('student_class', sa.String(length=50), nullable=False),
+    sa.Column('term', sa.String(length=50), nullable=False),
+    sa.Column('academic_year', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('progress', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('result_path', sa.String(length=255), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('requested_by', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['requested_by'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_report_jobs_status'), 'report_jobs', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_report_jobs_status'), table_name='report_jobs')
+    op.drop_table('report_jobs')
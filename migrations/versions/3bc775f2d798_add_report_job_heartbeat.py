@@ -0,0 +1,26 @@
+"""Add heartbeat_at to report_jobs
+
+Revision ID: 3bc775f2d798
+Revises: 604a14143540
+Create Date: 2026-10-18 09:41:27.518340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3bc775f2d798'
+down_revision = '604a14143540'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('report_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('report_jobs', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
@@ -0,0 +1,52 @@
+"""Store money as integer kobo
+
+Revision ID: 4585e616169e
+Revises: ab3729ee7a0e
+Create Date: 2026-10-16 23:41:08.275190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4585e616169e'
+down_revision = 'ab3729ee7a0e'
+branch_labels = None
+depends_on = None
+
+MONEY_COLUMNS = {
+    'payments': ('amount_paid',),
+    'fees': ('amount',),
+    'student_term_balances': ('expected_amount', 'amount_paid'),
+}
+
+
+def upgrade():
+    # Scale to kobo while the columns are still floating point, then make
+    # them integers; ROUND() absorbs any drift already in the stored values.
+    for table, columns in MONEY_COLUMNS.items():
+        op.execute(f"UPDATE {table} SET " + ', '.join(f'{column} = ROUND({column} * 100)' for column in columns))
+
+    for table, columns in MONEY_COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column,
+                       existing_type=sa.Float(),
+                       type_=sa.BigInteger(),
+                       existing_nullable=False,
+                       postgresql_using=f'{column}::bigint')
+
+
+def downgrade():
+    for table, columns in MONEY_COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column,
+                       existing_type=sa.BigInteger(),
+                       type_=sa.Float(),
+                       existing_nullable=False,
+                       postgresql_using=f'{column}::double precision')
+
+    for table, columns in MONEY_COLUMNS.items():
+        op.execute(f"UPDATE {table} SET " + ', '.join(f'{column} = {column} / 100.0' for column in columns))
@@ -0,0 +1,212 @@
+"""Add periods table and reference it from payments, fees and balances
+
+Revision ID: 57fc02daa789
+Revises: d700e8eea68a
+Create Date: 2026-10-17 14:05:33.482019
+
+"""
+import calendar
+import re
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '57fc02daa789'
+down_revision = 'd700e8eea68a'
+branch_labels = None
+depends_on = None
+
+TERMS = ('First Term', 'Second Term', 'Third Term')
+
+ACADEMIC_YEAR = re.compile(r'^(\d{4})/(\d{4})$')
+
+# Default term dates, as in app/periods.py at the time of this migration:
+# (years after the academic year's first year, first month, last month).
+TERM_CALENDAR = {
+    'First Term': (0, 9, 12),
+    'Second Term': (1, 1, 4),
+    'Third Term': (1, 5, 8),
+}
+
+# (table, length of its academic_year column)
+PERIOD_TABLES = [
+    ('payments', 10),
+    ('fees', 50),
+]
+
+
+def _period_values(academic_year, term):
+    match = ACADEMIC_YEAR.match(academic_year or '')
+    if not match or int(match.group(2)) != int(match.group(1)) + 1 or term not in TERMS:
+        return None
+    first_year = int(match.group(1))
+    offset, first_month, last_month = TERM_CALENDAR[term]
+    year = first_year + offset
+    return {
+        'academic_year': academic_year,
+        'term': term,
+        'sequence': first_year * len(TERMS) + TERMS.index(term),
+        'start_date': date(year, first_month, 1),
+        'end_date': date(year, last_month, calendar.monthrange(year, last_month)[1]),
+    }
+
+
+def _create_periods(connection):
+    """
+    One period per academic year and term found in payments and fees.
+    """
+    pairs = set()
+    for table_name, _ in PERIOD_TABLES:
+        pairs.update(
+            tuple(row) for row in connection.execute(sa.text(f'SELECT DISTINCT academic_year, term FROM {table_name}'))
+        )
+
+    values = []
+    unreadable = []
+    for academic_year, term in sorted(pairs):
+        period = _period_values(academic_year, term)
+        if period is None:
+            unreadable.append(f'{term!r} {academic_year!r}')
+        else:
+            values.append(period)
+    if unreadable:
+        raise RuntimeError(
+            'Cannot turn these terms and academic years into periods; correct them and run the upgrade again:\n  '
+            + '\n  '.join(unreadable[:50])
+        )
+
+    if values:
+        periods = sa.table(
+            'periods',
+            sa.column('academic_year', sa.String()),
+            sa.column('term', sa.String()),
+            sa.column('sequence', sa.Integer()),
+            sa.column('start_date', sa.Date()),
+            sa.column('end_date', sa.Date()),
+        )
+        connection.execute(periods.insert(), values)
+
+
+def upgrade():
+    op.create_table('periods',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('academic_year', sa.String(length=10), nullable=False),
+    sa.Column('term', sa.String(length=50), nullable=False),
+    sa.Column('sequence', sa.Integer(), nullable=False),
+    sa.Column('start_date', sa.Date(), nullable=False),
+    sa.Column('end_date', sa.Date(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('academic_year', 'term', name='_period_year_term_uc'),
+    sa.UniqueConstraint('sequence')
+    )
+    _create_periods(op.get_bind())
+
+    for table_name, _ in PERIOD_TABLES:
+        op.add_column(table_name, sa.Column('period_id', sa.Integer(), nullable=True))
+        op.execute(f"""
+            UPDATE {table_name} SET period_id = (
+                SELECT periods.id FROM periods
+                WHERE periods.academic_year = {table_name}.academic_year
+                  AND periods.term = {table_name}.term
+            )
+        """)
+
+    op.drop_index('ix_payments_period', table_name='payments')
+    op.drop_index('ix_payments_student_period', table_name='payments')
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.drop_constraint('_year_term_class_uc', type_='unique')
+
+    for table_name, _ in PERIOD_TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_column('term')
+            batch_op.drop_column('academic_year')
+            batch_op.alter_column('period_id', existing_type=sa.Integer(), nullable=False)
+            batch_op.create_foreign_key(f'fk_{table_name}_period_id_periods', 'periods', ['period_id'], ['id'])
+
+    op.create_index('ix_payments_student_period', 'payments', ['student_reg_number', 'period_id'], unique=False)
+    op.create_index('ix_payments_period', 'payments', ['period_id'], unique=False)
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.create_unique_constraint('_period_class_uc', ['period_id', 'class_id'])
+
+    # The ledger is derived data: rebuild it on the new key (same as `flask rebuild-balances`).
+    op.drop_table('student_term_balances')
+    op.create_table('student_term_balances',
+    sa.Column('student_reg_number', sa.String(length=20), nullable=False),
+    sa.Column('period_id', sa.Integer(), nullable=False),
+    sa.Column('expected_amount', sa.BigInteger(), nullable=False),
+    sa.Column('amount_paid', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['period_id'], ['periods.id'], ),
+    sa.ForeignKeyConstraint(['student_reg_number'], ['students.reg_number'], ),
+    sa.PrimaryKeyConstraint('student_reg_number', 'period_id')
+    )
+    op.execute("""
+        INSERT INTO student_term_balances
+            (student_reg_number, period_id, expected_amount, amount_paid)
+        SELECT t.student_reg_number, t.period_id, COALESCE(f.amount, 0), t.amount_paid
+        FROM (
+            SELECT student_reg_number, period_id, SUM(amount_paid) AS amount_paid
+            FROM payments
+            GROUP BY student_reg_number, period_id
+        ) t
+        JOIN students s ON s.reg_number = t.student_reg_number
+        LEFT JOIN fees f
+            ON f.class_id = s.class_id
+            AND f.period_id = t.period_id
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_payments_period', table_name='payments')
+    op.drop_index('ix_payments_student_period', table_name='payments')
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.drop_constraint('_period_class_uc', type_='unique')
+
+    for table_name, year_length in PERIOD_TABLES:
+        op.add_column(table_name, sa.Column('term', sa.String(length=50), nullable=True))
+        op.add_column(table_name, sa.Column('academic_year', sa.String(length=year_length), nullable=True))
+        op.execute(f"""
+            UPDATE {table_name} SET
+                term = (SELECT periods.term FROM periods WHERE periods.id = {table_name}.period_id),
+                academic_year = (SELECT periods.academic_year FROM periods WHERE periods.id = {table_name}.period_id)
+        """)
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_constraint(f'fk_{table_name}_period_id_periods', type_='foreignkey')
+            batch_op.drop_column('period_id')
+            batch_op.alter_column('term', existing_type=sa.String(length=50), nullable=False)
+            batch_op.alter_column('academic_year', existing_type=sa.String(length=year_length), nullable=False)
+
+    op.create_index('ix_payments_student_period', 'payments', ['student_reg_number', 'academic_year', 'term'], unique=False)
+    op.create_index('ix_payments_period', 'payments', ['academic_year', 'term'], unique=False)
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.create_unique_constraint('_year_term_class_uc', ['academic_year', 'term', 'class_id'])
+
+    op.drop_table('student_term_balances')
+    op.create_table('student_term_balances',
+    sa.Column('student_reg_number', sa.String(length=20), nullable=False),
+    sa.Column('academic_year', sa.String(length=50), nullable=False),
+    sa.Column('term', sa.String(length=50), nullable=False),
+    sa.Column('expected_amount', sa.BigInteger(), nullable=False),
+    sa.Column('amount_paid', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['student_reg_number'], ['students.reg_number'], ),
+    sa.PrimaryKeyConstraint('student_reg_number', 'academic_year', 'term')
+    )
+    op.execute("""
+        INSERT INTO student_term_balances
+            (student_reg_number, academic_year, term, expected_amount, amount_paid)
+        SELECT t.student_reg_number, t.academic_year, t.term, COALESCE(f.amount, 0), t.amount_paid
+        FROM (
+            SELECT student_reg_number, academic_year, term, SUM(amount_paid) AS amount_paid
+            FROM payments
+            GROUP BY student_reg_number, academic_year, term
+        ) t
+        JOIN students s ON s.reg_number = t.student_reg_number
+        LEFT JOIN fees f
+            ON f.class_id = s.class_id
+            AND f.term = t.term
+            AND f.academic_year = t.academic_year
+    """)
+
+    op.drop_table('periods')
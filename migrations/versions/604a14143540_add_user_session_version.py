@@ -0,0 +1,26 @@
+"""Add session_version to users
+
+Revision ID: 604a14143540
+Revises: 57fc02daa789
+Create Date: 2026-10-17 16:22:08.630154
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '604a14143540'
+down_revision = '57fc02daa789'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('session_version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('session_version')
@@ -0,0 +1,49 @@
+"""Add student_term_balances ledger
+
+Revision ID: 81af428949b9
+Revises: 2598e9581e10
+Create Date: 2026-10-16 09:12:40.218311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '81af428949b9'
+down_revision = '2598e9581e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('student_term_balances',
+    sa.Column('student_reg_number', sa.String(length=20), nullable=False),
+    sa.Column('academic_year', sa.String(length=50), nullable=False),
+    sa.Column('term', sa.String(length=50), nullable=False),
+    sa.Column('expected_amount', sa.Float(), nullable=False),
+    sa.Column('amount_paid', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['student_reg_number'], ['students.reg_number'], ),
+    sa.PrimaryKeyConstraint('student_reg_number', 'academic_year', 'term')
+    )
+
+    # Backfill from the existing payment history (same as `flask rebuild-balances`).
+    op.execute("""
+        INSERT INTO student_term_balances
+            (student_reg_number, academic_year, term, expected_amount, amount_paid)
+        SELECT t.student_reg_number, t.academic_year, t.term, COALESCE(f.amount, 0.0), t.amount_paid
+        FROM (
+            SELECT student_reg_number, academic_year, term, SUM(amount_paid) AS amount_paid
+            FROM payments
+            GROUP BY student_reg_number, academic_year, term
+        ) t
+        JOIN students s ON s.reg_number = t.student_reg_number
+        LEFT JOIN fees f
+            ON f.student_class = s.student_class
+            AND f.term = t.term
+            AND f.academic_year = t.academic_year
+    """)
+
+
+def downgrade():
+    op.drop_table('student_term_balances')
@@ -0,0 +1,42 @@
+"""Add indexes on hot query columns
+
+Revision ID: 9318e00c90c9
+Revises: 81af428949b9
+Create Date: 2026-10-16 10:03:27.540912
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9318e00c90c9'
+down_revision = '81af428949b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_payments_student_period', 'payments', ['student_reg_number', 'academic_year', 'term'], unique=False)
+    op.create_index('ix_payments_period', 'payments', ['academic_year', 'term'], unique=False)
+    op.create_index('ix_students_class_name', 'students', ['student_class', 'name', 'reg_number'], unique=False)
+    op.create_index('ix_students_term', 'students', ['term'], unique=False)
+    op.create_index(op.f('ix_students_admission_date'), 'students', ['admission_date'], unique=False)
+    op.create_index(op.f('ix_users_role'), 'users', ['role'], unique=False)
+
+    # Put the period columns first in the fee uniqueness index.
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.drop_constraint('_class_term_year_uc', type_='unique')
+        batch_op.create_unique_constraint('_year_term_class_uc', ['academic_year', 'term', 'student_class'])
+
+
+def downgrade():
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.drop_constraint('_year_term_class_uc', type_='unique')
+        batch_op.create_unique_constraint('_class_term_year_uc', ['student_class', 'term', 'academic_year'])
+
+    op.drop_index(op.f('ix_users_role'), table_name='users')
+    op.drop_index(op.f('ix_students_admission_date'), table_name='students')
+    op.drop_index('ix_students_term', table_name='students')
+    op.drop_index('ix_students_class_name', table_name='students')
+    op.drop_index('ix_payments_period', table_name='payments')
+    op.drop_index('ix_payments_student_period', table_name='payments')
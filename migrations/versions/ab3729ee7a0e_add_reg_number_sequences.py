@@ -0,0 +1,47 @@
+"""Add reg_number_sequences allocator table
+
+Revision ID: ab3729ee7a0e
+Revises: 175ebdec78ab
+Create Date: 2026-10-16 23:05:17.604821
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ab3729ee7a0e'
+down_revision = '175ebdec78ab'
+branch_labels = None
+depends_on = None
+
+REG_NUMBER = re.compile(r'^([A-Za-z]{1,10})/(\d{2})/(\d+)$')
+
+
+def upgrade():
+    sequences = op.create_table('reg_number_sequences',
+    sa.Column('prefix', sa.String(length=10), nullable=False),
+    sa.Column('year', sa.String(length=2), nullable=False),
+    sa.Column('last_value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('prefix', 'year')
+    )
+
+    # Seed each prefix/year with the highest number already in use.
+    highest = {}
+    for (reg_number,) in op.get_bind().execute(sa.text('SELECT reg_number FROM students')):
+        match = REG_NUMBER.match(reg_number or '')
+        if match:
+            key = (match.group(1), match.group(2))
+            highest[key] = max(highest.get(key, 0), int(match.group(3)))
+
+    if highest:
+        op.bulk_insert(sequences, [
+            {'prefix': prefix, 'year': year, 'last_value': last_value}
+            for (prefix, year), last_value in sorted(highest.items())
+        ])
+
+
+def downgrade():
+    op.drop_table('reg_number_sequences')
@@ -0,0 +1,155 @@
+"""Store dates as DATE columns
+
+Revision ID: cbdb5413baad
+Revises: 4585e616169e
+Create Date: 2026-10-17 00:18:52.903317
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cbdb5413baad'
+down_revision = '4585e616169e'
+branch_labels = None
+depends_on = None
+
+# (table, primary key, date columns)
+DATE_COLUMNS = [
+    ('students', 'reg_number', ('dob', 'admission_date')),
+    ('payments', 'id', ('payment_date',)),
+]
+
+# Rows converted per round trip during the backfill.
+BATCH_SIZE = 1000
+
+# Formats seen in the existing string columns, most common first.
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d')
+
+# Rebuilding `students` on SQLite drops its full-text search triggers, and
+# the copied rows get new rowids, so both are recreated afterwards.
+SQLITE_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER students_search_insert AFTER INSERT ON students BEGIN
+        INSERT INTO student_search (rowid, reg_number, name)
+        VALUES (NEW.rowid, NEW.reg_number, NEW.name);
+    END
+    """,
+    """
+    CREATE TRIGGER students_search_update AFTER UPDATE OF reg_number, name ON students BEGIN
+        DELETE FROM student_search WHERE rowid = OLD.rowid;
+        INSERT INTO student_search (rowid, reg_number, name)
+        VALUES (NEW.rowid, NEW.reg_number, NEW.name);
+    END
+    """,
+    """
+    CREATE TRIGGER students_search_delete AFTER DELETE ON students BEGIN
+        DELETE FROM student_search WHERE rowid = OLD.rowid;
+    END
+    """,
+    'DELETE FROM student_search',
+    """
+    INSERT INTO student_search (rowid, reg_number, name)
+    SELECT rowid, reg_number, name FROM students
+    """,
+]
+
+
+def _parse_date(text):
+    text = (text or '').strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _backfill(table_name, key, columns):
+    """
+    Fills the new `<column>_new` DATE columns from the string columns,
+    BATCH_SIZE rows at a time in primary key order.
+    """
+    connection = op.get_bind()
+    table = sa.table(
+        table_name,
+        sa.column(key),
+        *[sa.column(column, sa.String()) for column in columns],
+        *[sa.column(f'{column}_new', sa.Date()) for column in columns]
+    )
+    update = (
+        table.update()
+        .where(table.c[key] == sa.bindparam('_key'))
+        .values({f'{column}_new': sa.bindparam(f'_{column}') for column in columns})
+    )
+
+    last_key = None
+    unreadable = []
+    while True:
+        query = sa.select(table.c[key], *[table.c[column] for column in columns]).order_by(table.c[key]).limit(BATCH_SIZE)
+        if last_key is not None:
+            query = query.where(table.c[key] > last_key)
+        rows = connection.execute(query).fetchall()
+        if not rows:
+            break
+
+        params = []
+        for row_key, *values in rows:
+            dates = [_parse_date(value) for value in values]
+            for column, value, parsed in zip(columns, values, dates):
+                if parsed is None:
+                    unreadable.append(f'{table_name}.{column} = {value!r} ({key} {row_key!r})')
+            params.append({'_key': row_key, **{f'_{column}': parsed for column, parsed in zip(columns, dates)}})
+        connection.execute(update, params)
+        last_key = rows[-1][0]
+
+    if unreadable:
+        raise RuntimeError(
+            'Cannot convert these values to dates; correct them and run the upgrade again:\n  '
+            + '\n  '.join(unreadable[:50])
+        )
+
+
+def upgrade():
+    for table_name, key, columns in DATE_COLUMNS:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            for column in columns:
+                batch_op.add_column(sa.Column(f'{column}_new', sa.Date(), nullable=True))
+
+        _backfill(table_name, key, columns)
+
+        if table_name == 'students':
+            op.drop_index('ix_students_admission_date', table_name='students')
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            for column in columns:
+                batch_op.drop_column(column)
+                batch_op.alter_column(f'{column}_new', new_column_name=column,
+                       existing_type=sa.Date(), nullable=False)
+
+    op.create_index('ix_students_admission_date', 'students', ['admission_date'], unique=False)
+    op.create_index('ix_payments_date_recorded_by', 'payments', ['payment_date', 'recorded_by'], unique=False)
+
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_SEARCH_TRIGGERS:
+            op.execute(statement)
+
+
+def downgrade():
+    op.drop_index('ix_payments_date_recorded_by', table_name='payments')
+
+    # DATE values are stored and cast as YYYY-MM-DD text.
+    for table_name, key, columns in DATE_COLUMNS:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column,
+                       existing_type=sa.Date(),
+                       type_=sa.String(length=10),
+                       existing_nullable=False,
+                       postgresql_using=f"to_char({column}, 'YYYY-MM-DD')")
+
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_SEARCH_TRIGGERS:
+            op.execute(statement)
@@ -0,0 +1,139 @@
+"""Reference classes by id from students, fees and teachers
+
+Revision ID: d700e8eea68a
+Revises: cbdb5413baad
+Create Date: 2026-10-17 09:41:27.114826
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd700e8eea68a'
+down_revision = 'cbdb5413baad'
+branch_labels = None
+depends_on = None
+
+# (table, old class name column, whether a class is required)
+CLASS_COLUMNS = [
+    ('students', 'student_class', True),
+    ('fees', 'student_class', True),
+    ('teachers', 'class_taught', False),
+]
+
+# Rebuilding `students` on SQLite drops its full-text search triggers, and
+# the copied rows get new rowids, so both are recreated afterwards.
+SQLITE_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER students_search_insert AFTER INSERT ON students BEGIN
+        INSERT INTO student_search (rowid, reg_number, name)
+        VALUES (NEW.rowid, NEW.reg_number, NEW.name);
+    END
+    """,
+    """
+    CREATE TRIGGER students_search_update AFTER UPDATE OF reg_number, name ON students BEGIN
+        DELETE FROM student_search WHERE rowid = OLD.rowid;
+        INSERT INTO student_search (rowid, reg_number, name)
+        VALUES (NEW.rowid, NEW.reg_number, NEW.name);
+    END
+    """,
+    """
+    CREATE TRIGGER students_search_delete AFTER DELETE ON students BEGIN
+        DELETE FROM student_search WHERE rowid = OLD.rowid;
+    END
+    """,
+    'DELETE FROM student_search',
+    """
+    INSERT INTO student_search (rowid, reg_number, name)
+    SELECT rowid, reg_number, name FROM students
+    """,
+]
+
+
+def _check_required(connection):
+    """
+    Every student and fee must end up with a class; a blank class name is
+    the only way one can be left without.
+    """
+    missing = []
+    for table_name, column, required in CLASS_COLUMNS:
+        if required:
+            count = connection.execute(sa.text(f'SELECT COUNT(*) FROM {table_name} WHERE class_id IS NULL')).scalar()
+            if count:
+                missing.append(f'{table_name}: {count} rows with a blank {column}')
+    if missing:
+        raise RuntimeError(
+            'Cannot assign a class to every row; fill in these classes and run the upgrade again:\n  '
+            + '\n  '.join(missing)
+        )
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    # Classes used by existing rows but never added on the classes page.
+    for table_name, column, required in CLASS_COLUMNS:
+        op.execute(f"""
+            INSERT INTO classes (name)
+            SELECT DISTINCT TRIM({column}) FROM {table_name}
+            WHERE TRIM({column}) <> ''
+              AND TRIM({column}) NOT IN (SELECT name FROM classes)
+        """)
+
+    for table_name, column, required in CLASS_COLUMNS:
+        op.add_column(table_name, sa.Column('class_id', sa.Integer(), nullable=True))
+        op.execute(f"""
+            UPDATE {table_name} SET class_id = (
+                SELECT classes.id FROM classes WHERE classes.name = TRIM({table_name}.{column})
+            )
+        """)
+    _check_required(connection)
+
+    op.drop_index('ix_students_class_name', table_name='students')
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.drop_constraint('_year_term_class_uc', type_='unique')
+
+    for table_name, column, required in CLASS_COLUMNS:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_column(column)
+            batch_op.alter_column('class_id', existing_type=sa.Integer(), nullable=not required)
+            batch_op.create_foreign_key(f'fk_{table_name}_class_id_classes', 'classes', ['class_id'], ['id'])
+
+    op.create_index('ix_students_class_name', 'students', ['class_id', 'name', 'reg_number'], unique=False)
+    op.create_index('ix_fees_class_id', 'fees', ['class_id'], unique=False)
+    op.create_index('ix_teachers_class_id', 'teachers', ['class_id'], unique=False)
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.create_unique_constraint('_year_term_class_uc', ['academic_year', 'term', 'class_id'])
+
+    if connection.dialect.name == 'sqlite':
+        for statement in SQLITE_SEARCH_TRIGGERS:
+            op.execute(statement)
+
+
+def downgrade():
+    op.drop_index('ix_teachers_class_id', table_name='teachers')
+    op.drop_index('ix_fees_class_id', table_name='fees')
+    op.drop_index('ix_students_class_name', table_name='students')
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.drop_constraint('_year_term_class_uc', type_='unique')
+
+    for table_name, column, required in CLASS_COLUMNS:
+        op.add_column(table_name, sa.Column(column, sa.String(length=50), nullable=True))
+        op.execute(f"""
+            UPDATE {table_name} SET {column} = (
+                SELECT classes.name FROM classes WHERE classes.id = {table_name}.class_id
+            )
+        """)
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_constraint(f'fk_{table_name}_class_id_classes', type_='foreignkey')
+            batch_op.drop_column('class_id')
+            batch_op.alter_column(column, existing_type=sa.String(length=50), nullable=not required)
+
+    op.create_index('ix_students_class_name', 'students', ['student_class', 'name', 'reg_number'], unique=False)
+    with op.batch_alter_table('fees', schema=None) as batch_op:
+        batch_op.create_unique_constraint('_year_term_class_uc', ['academic_year', 'term', 'student_class'])
+
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_SEARCH_TRIGGERS:
+            op.execute(statement)
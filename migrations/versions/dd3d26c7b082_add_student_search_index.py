@@ -0,0 +1,82 @@
+"""Add student full-text search index
+
+Revision ID: dd3d26c7b082
+Revises: 9318e00c90c9
+Create Date: 2026-10-16 11:26:05.771904
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'dd3d26c7b082'
+down_revision = '9318e00c90c9'
+branch_labels = None
+depends_on = None
+
+
+# SQLite: an FTS5 table keyed by the students rowid, kept in sync by triggers.
+SQLITE_UPGRADE = [
+    """
+    CREATE VIRTUAL TABLE student_search USING fts5(
+        reg_number, name,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER students_search_insert AFTER INSERT ON students BEGIN
+        INSERT INTO student_search (rowid, reg_number, name)
+        VALUES (NEW.rowid, NEW.reg_number, NEW.name);
+    END
+    """,
+    """
+    CREATE TRIGGER students_search_update AFTER UPDATE OF reg_number, name ON students BEGIN
+        DELETE FROM student_search WHERE rowid = OLD.rowid;
+        INSERT INTO student_search (rowid, reg_number, name)
+        VALUES (NEW.rowid, NEW.reg_number, NEW.name);
+    END
+    """,
+    """
+    CREATE TRIGGER students_search_delete AFTER DELETE ON students BEGIN
+        DELETE FROM student_search WHERE rowid = OLD.rowid;
+    END
+    """,
+    """
+    INSERT INTO student_search (rowid, reg_number, name)
+    SELECT rowid, reg_number, name FROM students
+    """,
+]
+
+SQLITE_DOWNGRADE = [
+    'DROP TRIGGER IF EXISTS students_search_delete',
+    'DROP TRIGGER IF EXISTS students_search_update',
+    'DROP TRIGGER IF EXISTS students_search_insert',
+    'DROP TABLE IF EXISTS student_search',
+]
+
+# Postgres: trigram GIN indexes serve the LIKE '%q%' filter and similarity ranking.
+POSTGRES_UPGRADE = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX ix_students_name_trgm ON students USING gin (lower(name) gin_trgm_ops)',
+    'CREATE INDEX ix_students_reg_number_trgm ON students USING gin (lower(reg_number) gin_trgm_ops)',
+]
+
+POSTGRES_DOWNGRADE = [
+    'DROP INDEX IF EXISTS ix_students_reg_number_trgm',
+    'DROP INDEX IF EXISTS ix_students_name_trgm',
+]
+
+
+def _run(statements_by_dialect):
+    statements = statements_by_dialect.get(op.get_bind().dialect.name, [])
+    for statement in statements:
+        op.execute(statement)
+
+
+def upgrade():
+    _run({'sqlite': SQLITE_UPGRADE, 'postgresql': POSTGRES_UPGRADE})
+
+
+def downgrade():
+    _run({'sqlite': SQLITE_DOWNGRADE, 'postgresql': POSTGRES_DOWNGRADE})
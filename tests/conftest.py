@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('SECRET_KEY', 'test')
+    # Skip bcrypt calibration; tests hash nothing that needs a real cost.
+    monkeypatch.setenv('PASSWORD_HASH_ROUNDS', '4')
+
+    from app import create_app, db
+
+    app = create_app()
+    with app.app_context():
+        # The models declare the same indexes as the migrations.
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
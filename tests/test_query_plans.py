@@ -0,0 +1,14 @@
+def test_hot_queries_use_an_index(app):
+    from app.query_plans import check_query_plans
+
+    assert check_query_plans() == {}
+
+
+def test_missing_index_is_reported(app):
+    from app import db
+    from app.query_plans import check_query_plans
+
+    db.session.execute(db.text('DROP INDEX ix_payments_period'))
+    db.session.commit()
+
+    assert 'period_payments' in check_query_plans()
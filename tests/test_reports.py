@@ -0,0 +1,26 @@
+from datetime import date
+
+
+def test_report_pages_through_a_class_larger_than_a_batch(app, monkeypatch):
+    from app import db, reports
+    from app.models import Class, Student
+    from app.periods import ensure_period
+
+    school_class = Class(name='JSS 1')
+    db.session.add(school_class)
+    db.session.flush()
+    ensure_period('2025/2026', 'First Term')
+    names = ['Aisha Bello', 'Bola Ade', 'Chidi Okafor', 'Dayo Musa', 'Emeka Obi']
+    for number, name in enumerate(names, start=1):
+        db.session.add(Student(
+            reg_number=f'AAM/25/{number:04d}', name=name, dob=date(2014, 1, 1), gender='Female',
+            class_id=school_class.id, term='First Term', academic_year='2025/2026',
+            admission_date=date(2025, 9, 1)
+        ))
+    db.session.commit()
+
+    monkeypatch.setattr(reports, 'FETCH_BATCH_SIZE', 2)
+    rows = list(reports.iter_report_rows(reports.report_query('paid', 'JSS 1', '2025/2026', 'First Term')))
+
+    assert [row.name for row in rows] == names
+    assert {row.student_class for row in rows} == {'JSS 1'}